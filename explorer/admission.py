@@ -0,0 +1,93 @@
+import uuid
+from contextlib import contextmanager
+from time import sleep, time
+
+from django.core.cache import cache
+from django.db import DatabaseError
+
+from explorer import app_settings
+
+# Limits on how many queries may run at once on each connection, and for each user on each
+# connection. A query takes a slot of each limit that applies to it before it runs, waiting up
+# to EXPLORER_ADMISSION_TIMEOUT seconds for one to come free, and is rejected if none does.
+# Slots are keys added to the Django cache, so the limits hold across every web process and
+# Celery worker. Each slot expires along with the query's statement timeout, so that the slots
+# of processes that die while running a query are not lost.
+
+
+class QueryRejected(DatabaseError):
+    pass
+
+
+class Admission(object):
+    poll_interval = 0.1
+
+    def key(self, scope, slot):
+        return '_explorer_admission_%s_%s' % (scope, slot)
+
+    def limits(self, alias, user_id=None):
+        """
+        :return: The scopes whose limits apply to a query by user_id on the connection, with the
+         limit of each and the message to reject the query with, the user's own first.
+        """
+        limits = []
+        user_limit = app_settings.EXPLORER_MAX_CONCURRENT_QUERIES_PER_USER
+        if user_id is not None and user_limit:
+            message = (
+                'You already have %s queries running on this connection. Wait for one of them to'
+                ' finish before running another.' % user_limit
+            )
+            limits.append((f'{alias}_user_{user_id}', user_limit, message))
+        connection_limit = app_settings.EXPLORER_MAX_CONCURRENT_QUERIES.get(alias)
+        if connection_limit:
+            message = 'Too many queries are running on this connection. Try again shortly.'
+            limits.append((alias, connection_limit, message))
+        return limits
+
+    @contextmanager
+    def admit(self, alias, user_id=None, timeout=None):
+        """
+        Hold a slot of each limit on queries by user_id on the connection for as long as the
+        block runs.
+
+        :param timeout: The statement timeout of the query in ms.
+        :raises QueryRejected: When a slot didn't come free in time.
+        """
+        token = str(uuid.uuid4())
+        ttl = (timeout or app_settings.EXPLORER_QUERY_TIMEOUT_MS) // 1000 + 60
+        deadline = time() + app_settings.EXPLORER_ADMISSION_TIMEOUT
+        held = []
+        try:
+            # The user's own slot is taken first, so that a user who is over their limit waits
+            # without holding up the connection's slots
+            for scope, limit, message in self.limits(alias, user_id):
+                held.append(self._acquire(scope, limit, message, token, ttl, deadline))
+            yield
+        finally:
+            for key in held:
+                if cache.get(key) == token:
+                    cache.delete(key)
+
+    def _acquire(self, scope, limit, message, token, ttl, deadline):
+        while True:
+            for slot in range(limit):
+                key = self.key(scope, slot)
+                if cache.add(key, token, ttl):
+                    return key
+            if time() >= deadline:
+                raise QueryRejected(message)
+            sleep(self.poll_interval)
+
+    def running(self, alias, user_id=None):
+        """
+        :return: The number of queries holding a slot on the connection, or for user_id on it.
+        """
+        if user_id is None:
+            scope, limit = alias, app_settings.EXPLORER_MAX_CONCURRENT_QUERIES.get(alias) or 0
+        else:
+            scope = f'{alias}_user_{user_id}'
+            limit = app_settings.EXPLORER_MAX_CONCURRENT_QUERIES_PER_USER or 0
+        return len(cache.get_many([self.key(scope, slot) for slot in range(limit)]))
+
+
+admission = Admission()
@@ -7,6 +7,73 @@ EXPLORER_DEFAULT_ROWS = getattr(settings, 'EXPLORER_DEFAULT_ROWS', 1000)
 EXPLORER_QUERY_TIMEOUT_MS = getattr(settings, 'EXPLORER_QUERY_TIMEOUT_MS', 60000)
 EXPLORER_DEFAULT_DOWNLOAD_ROWS = getattr(settings, 'EXPLORER_DEFAULT_DOWNLOAD_ROWS', 1000)
 
+# Once a user fetches a page of results after the first, keep a cursor for the query open, on
+# its own connection, so that fetching the pages after it doesn't run the query again. The
+# cursor is declared WITH HOLD, so Postgres stores the whole result of the query, in memory or
+# in temporary files on the database server, when it is declared, and each kept cursor holds a
+# connection. Idle cursors are closed after this many seconds, and the least recently used are
+# closed when there are more than EXPLORER_PAGING_CURSOR_MAX. 0 turns this off.
+EXPLORER_PAGING_CURSOR_TTL = getattr(settings, 'EXPLORER_PAGING_CURSOR_TTL', 0)
+EXPLORER_PAGING_CURSOR_MAX = getattr(settings, 'EXPLORER_PAGING_CURSOR_MAX', 20)
+
+# Stop counting the rows of a result after this many, and show the query planner's estimate of
+# the total instead. None counts every row.
+EXPLORER_EXACT_COUNT_THRESHOLD = getattr(settings, 'EXPLORER_EXACT_COUNT_THRESHOLD', None)
+
+# Keep pages of results in the Django cache for this many seconds, so that running the same SQL
+# again doesn't go to the database. Pages of more than EXPLORER_RESULT_CACHE_MAX_ROWS rows are
+# not cached, and the oldest results are evicted once more than EXPLORER_RESULT_CACHE_MAX_ENTRIES
+# are cached. 0 turns this off.
+EXPLORER_RESULT_CACHE_TTL = getattr(settings, 'EXPLORER_RESULT_CACHE_TTL', 0)
+EXPLORER_RESULT_CACHE_MAX_ROWS = getattr(settings, 'EXPLORER_RESULT_CACHE_MAX_ROWS', 10000)
+EXPLORER_RESULT_CACHE_MAX_ENTRIES = getattr(settings, 'EXPLORER_RESULT_CACHE_MAX_ENTRIES', 100)
+
+# A page of results shown with a button for its column statistics can be summarised for this many
+# seconds. Only the SQL and params are kept for it, and the page is fetched from the result cache,
+# or run again if it isn't cached
+EXPLORER_STATS_PAGE_TTL = getattr(settings, 'EXPLORER_STATS_PAGE_TTL', 3600)
+
+# Summarise the numeric columns of a result that doesn't fit on one page with an aggregate query
+# over the whole result, rather than over the rows of the page. The totals are cached for
+# EXPLORER_FULL_RESULT_STATS_TTL seconds.
+EXPLORER_FULL_RESULT_STATS = getattr(settings, 'EXPLORER_FULL_RESULT_STATS', False)
+EXPLORER_FULL_RESULT_STATS_TTL = getattr(settings, 'EXPLORER_FULL_RESULT_STATS_TTL', 600)
+
+# Connection pools, one per Explorer connection, shared by schema introspection and by
+# connections using the explorer.pooled_postgresql database backend. Up to EXPLORER_POOL_SIZE
+# connections are kept open, and EXPLORER_POOL_MAX_OVERFLOW more may be opened under load.
+# Getting a connection fails after waiting EXPLORER_POOL_TIMEOUT seconds for one, and
+# connections are replaced once they are EXPLORER_POOL_RECYCLE seconds old.
+EXPLORER_POOL_SIZE = getattr(settings, 'EXPLORER_POOL_SIZE', 5)
+EXPLORER_POOL_MAX_OVERFLOW = getattr(settings, 'EXPLORER_POOL_MAX_OVERFLOW', 5)
+EXPLORER_POOL_TIMEOUT = getattr(settings, 'EXPLORER_POOL_TIMEOUT', 30)
+EXPLORER_POOL_RECYCLE = getattr(settings, 'EXPLORER_POOL_RECYCLE', 1800)
+
+# Read-only replicas of Explorer connections, as lists of Django database aliases keyed by the
+# alias of the connection they replicate. Queries are spread over the replicas that lag behind
+# by no more than EXPLORER_REPLICA_MAX_LAG seconds, by their load, which is measured along with
+# the lag every EXPLORER_REPLICA_CHECK_INTERVAL seconds.
+EXPLORER_READ_REPLICAS = getattr(settings, 'EXPLORER_READ_REPLICAS', {})
+EXPLORER_REPLICA_MAX_LAG = getattr(settings, 'EXPLORER_REPLICA_MAX_LAG', 30)
+EXPLORER_REPLICA_CHECK_INTERVAL = getattr(settings, 'EXPLORER_REPLICA_CHECK_INTERVAL', 10)
+
+# Limits on the queries that may run at once on each Explorer connection, keyed by connection
+# alias, and for each user on any one connection. Queries over a limit wait up to
+# EXPLORER_ADMISSION_TIMEOUT seconds for another to finish, and are then rejected.
+EXPLORER_MAX_CONCURRENT_QUERIES = getattr(settings, 'EXPLORER_MAX_CONCURRENT_QUERIES', {})
+EXPLORER_MAX_CONCURRENT_QUERIES_PER_USER = getattr(
+    settings, 'EXPLORER_MAX_CONCURRENT_QUERIES_PER_USER', None
+)
+EXPLORER_ADMISSION_TIMEOUT = getattr(settings, 'EXPLORER_ADMISSION_TIMEOUT', 10)
+
+# Stream the full result of a download from a server-side cursor instead of
+# returning the first EXPLORER_DEFAULT_DOWNLOAD_ROWS rows
+EXPLORER_STREAMING_EXPORTS = getattr(settings, 'EXPLORER_STREAMING_EXPORTS', False)
+EXPLORER_STREAMING_FETCH_SIZE = getattr(settings, 'EXPLORER_STREAMING_FETCH_SIZE', 2000)
+# Have Postgres produce streamed CSV downloads itself with COPY ... TO STDOUT. Values are then
+# formatted by Postgres, e.g. booleans as t/f and rows ending in a bare newline.
+EXPLORER_CSV_COPY_EXPORTS = getattr(settings, 'EXPLORER_CSV_COPY_EXPORTS', False)
+
 EXPLORER_SCHEMA_EXCLUDE_TABLE_PREFIXES = getattr(
     settings,
     'EXPLORER_SCHEMA_EXCLUDE_TABLE_PREFIXES',
@@ -19,6 +86,22 @@ EXPLORER_SCHEMA_INCLUDE_TABLE_PREFIXES = getattr(
 EXPLORER_SCHEMA_INCLUDE_VIEWS = getattr(settings, 'EXPLORER_SCHEMA_INCLUDE_VIEWS', False)
 
 EXPLORER_RECENT_QUERY_COUNT = getattr(settings, 'EXPLORER_RECENT_QUERY_COUNT', 10)
+
+# Write query logs in batches from a background thread every this many seconds, or sooner once
+# EXPLORER_QUERY_LOG_BATCH_SIZE are waiting, instead of as queries are run. Up to
+# EXPLORER_QUERY_LOG_MAX_PENDING logs are kept while they can't be written. 0 turns this off.
+EXPLORER_QUERY_LOG_FLUSH_INTERVAL = getattr(settings, 'EXPLORER_QUERY_LOG_FLUSH_INTERVAL', 0)
+EXPLORER_QUERY_LOG_BATCH_SIZE = getattr(settings, 'EXPLORER_QUERY_LOG_BATCH_SIZE', 500)
+EXPLORER_QUERY_LOG_MAX_PENDING = getattr(settings, 'EXPLORER_QUERY_LOG_MAX_PENDING', 10000)
+
+# How many query logs, or query jobs, truncate_querylogs deletes in each transaction
+EXPLORER_QUERY_LOG_DELETE_BATCH_SIZE = getattr(
+    settings, 'EXPLORER_QUERY_LOG_DELETE_BATCH_SIZE', 10000
+)
+
+# A query's last_run_date is updated when it is viewed at most once in this many seconds
+EXPLORER_QUERY_TOUCH_INTERVAL = getattr(settings, 'EXPLORER_QUERY_TOUCH_INTERVAL', 60)
+
 EXPLORER_ASYNC_SCHEMA = getattr(settings, 'EXPLORER_ASYNC_SCHEMA', False)
 
 EXPLORER_DATA_EXPORTERS = getattr(
@@ -39,3 +122,8 @@ EXPLORER_TOKEN = getattr(settings, 'EXPLORER_TOKEN', 'CHANGEME')
 # Async task related. Note that the EMAIL_HOST settings must be set up for email to work.
 ENABLE_TASKS = getattr(settings, "EXPLORER_TASKS_ENABLED", False)
 UNSAFE_RENDERING = getattr(settings, "EXPLORER_UNSAFE_RENDERING", False)
+
+# Run playground queries as QueryJobs on a Celery worker, and have the browser poll for the
+# result, rather than running them in the web request. Needs EXPLORER_TASKS_ENABLED.
+EXPLORER_ASYNC_QUERIES = getattr(settings, 'EXPLORER_ASYNC_QUERIES', False)
+EXPLORER_QUERY_JOB_RESULT_TTL = getattr(settings, 'EXPLORER_QUERY_JOB_RESULT_TTL', 3600)
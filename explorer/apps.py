@@ -26,6 +26,12 @@ def _get_explorer_connections():
     return EXPLORER_CONNECTIONS
 
 
+def _get_read_replicas():
+    from explorer.app_settings import EXPLORER_READ_REPLICAS
+
+    return EXPLORER_READ_REPLICAS
+
+
 def _validate_connections():
 
     # Validate connections
@@ -41,3 +47,16 @@ def _validate_connections():
                 'EXPLORER_CONNECTIONS contains (%s, %s), but %s'
                 ' is not a valid Django DB connection.' % (name, conn_name, conn_name)
             )
+
+    for conn_name, replicas in _get_read_replicas().items():
+        if conn_name not in _get_explorer_connections().values():
+            raise ImproperlyConfigured(
+                'EXPLORER_READ_REPLICAS has replicas of %s, but that alias is not'
+                ' present in the values of EXPLORER_CONNECTIONS' % conn_name
+            )
+        for replica in replicas:
+            if replica not in djcs:
+                raise ImproperlyConfigured(
+                    'EXPLORER_READ_REPLICAS lists %s as a replica of %s, but %s'
+                    ' is not a valid Django DB connection.' % (replica, conn_name, replica)
+                )
@@ -0,0 +1,75 @@
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+from explorer.utils import get_valid_connection
+
+# Queries on Postgres are registered here with the PID of the backend running them while they
+# execute, under an execution id chosen by whoever started them, so that they can be cancelled
+# with pg_cancel_backend from another request. The registry is kept in the Django cache so that
+# it is shared by every web process and Celery worker.
+
+# Connections are pooled, so by the time a query is cancelled its backend may be running someone
+# else's. Each registered query sets the application_name of its backend to a token of its own
+# while it runs, and is only cancelled while its backend still has that name.
+
+
+class RunningQueries(object):
+    def key(self, execution_id):
+        return '_explorer_running_query_%s' % execution_id
+
+    @contextmanager
+    def register(self, execution_id, cursor, user_id, timeout):
+        """
+        Register the query run by this cursor for as long as the block runs.
+
+        :param timeout: The statement timeout of the query in ms, after which the registration
+         is no longer needed.
+        """
+        key = self.key(execution_id)
+        token = uuid.uuid4().hex
+        # Inside a transaction the name reverts when it ends, whether or not it fails, and
+        # otherwise it is put back for whoever uses the connection next
+        local = cursor.db.in_atomic_block
+        with cursor.db.cursor() as c:
+            c.execute("SELECT current_setting('application_name')")
+            previous = c.fetchone()[0]
+            c.execute("SELECT set_config('application_name', %s, %s)", [token, local])
+        entry = {
+            'alias': cursor.db.alias,
+            'pid': cursor.db.connection.get_backend_pid(),
+            'token': token,
+            'user_id': user_id,
+        }
+        cache.set(key, entry, timeout // 1000 + 60)
+        try:
+            yield
+        finally:
+            cache.delete(key)
+            if not local:
+                with cursor.db.cursor() as c:
+                    c.execute("SELECT set_config('application_name', %s, false)", [previous])
+
+    def cancel(self, execution_id, user_id=None, check_user=True):
+        """
+        :param check_user: Only cancel a query registered by user_id.
+        :return: Whether a running query was signalled to cancel.
+        """
+        entry = cache.get(self.key(execution_id))
+        if entry is None or (check_user and entry['user_id'] != user_id):
+            return False
+        with get_valid_connection(entry['alias']).cursor() as cursor:
+            # Activity is read from a snapshot kept until the end of the transaction, which
+            # may have been taken before the query was registered
+            cursor.execute('SELECT pg_stat_clear_snapshot()')
+            cursor.execute(
+                'SELECT pg_cancel_backend(pid) FROM pg_stat_activity'
+                ' WHERE pid = %s AND application_name = %s',
+                [entry['pid'], entry['token']],
+            )
+            row = cursor.fetchone()
+            return bool(row and row[0])
+
+
+running_queries = RunningQueries()
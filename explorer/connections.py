@@ -1,6 +1,6 @@
 from django.db import connections as djcs
 
-from explorer.app_settings import EXPLORER_CONNECTIONS
+from explorer.app_settings import EXPLORER_CONNECTIONS, EXPLORER_READ_REPLICAS
 
 # We export valid SQL connections here so that consuming code never has to
 # deal with django.db.connections directly, and risk accessing a connection
@@ -11,7 +11,11 @@ from explorer.app_settings import EXPLORER_CONNECTIONS
 # connections, but does a 'live' lookup of the connection on each item access.
 
 
-_connections = {c: c for c in djcs if c in EXPLORER_CONNECTIONS.values()}
+# The read replicas of a connection count as valid too, as queries routed to them must be
+# reachable again by alias, for example to be cancelled.
+
+_replicas = [r for aliases in EXPLORER_READ_REPLICAS.values() for r in aliases]
+_connections = {c: c for c in djcs if c in EXPLORER_CONNECTIONS.values() or c in _replicas}
 
 
 class ExplorerConnections(dict):
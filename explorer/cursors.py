@@ -0,0 +1,143 @@
+import hashlib
+import threading
+import uuid
+from contextlib import contextmanager
+from time import sleep, time
+
+from explorer import app_settings
+from explorer.replicas import replicas
+from explorer.utils import ProcessThread
+
+# Paging through a result with a fresh cursor for every page re-runs the query and skips over
+# all the earlier rows each time. Instead, once a user fetches a page after the first, a cursor
+# is declared and kept open, on a connection of its own, so that the pages after it of the same
+# SQL for the same user can be fetched from it directly. Only then, since a cursor WITH HOLD
+# makes Postgres store the whole result of the query when it is declared.
+
+# Django connections belong to the thread that created them and each request may be served by
+# a different thread, so kept cursors live on copies of the Explorer connection that are shared
+# between threads. Access to each kept cursor is serialised by its own lock.
+
+# Idle cursors are closed when another is checked out, and by a background thread in each
+# process that keeps cursors, so that a process that gets no more paging requests doesn't hold
+# their connections open.
+
+
+class KeptCursor(object):
+    def __init__(self, connection):
+        self.connection = connection.copy()
+        self.connection.inc_thread_sharing()
+        # The connection is held for as long as the cursor is kept, so it's opened outside of any
+        # connection pool rather than taking up one of the pool's connections
+        self.connection.use_pool = False
+        self.name = 'kept_%s' % str(uuid.uuid4()).replace('-', '')[:10]
+        self.declared = False
+        self.row_count = None
+        self.row_count_is_estimate = False
+        self.closed = False
+        self.last_used = time()
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.closed = True
+        self.connection.close()
+
+
+class KeptCursors(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cursors = {}
+        self._reaper = ProcessThread(self._reap)
+
+    @property
+    def enabled(self):
+        return app_settings.EXPLORER_PAGING_CURSOR_TTL > 0
+
+    def key(self, connection, user_id, sql, params=None):
+        digest = hashlib.sha256('\0'.join([sql, repr(params or [])]).encode('utf-8')).hexdigest()
+        return connection.alias, user_id, digest
+
+    @contextmanager
+    def checkout(self, connection, user_id, sql, params=None):
+        """
+        Yield the KeptCursor for this user's SQL on this connection, holding its lock.
+
+        :param params: The values bound to the placeholders of the SQL.
+        """
+        self.close_idle()
+        key = self.key(connection, user_id, sql, params)
+        while True:
+            kept = self._get(connection, key)
+            kept.lock.acquire()
+            if not kept.closed:
+                break
+            # It expired while we were waiting for it
+            kept.lock.release()
+        try:
+            yield kept
+        except Exception:
+            self._remove(key, kept)
+            kept.close()
+            raise
+        else:
+            kept.last_used = time()
+        finally:
+            kept.lock.release()
+
+    def _get(self, connection, key):
+        with self._lock:
+            kept = self._cursors.get(key)
+            if kept is not None:
+                return kept
+            new = self._cursors[key] = KeptCursor(replicas.choose(connection))
+        self._reaper.start()
+        return new
+
+    def discard(self, connection, user_id, sql, params=None):
+        """
+        Close the cursor kept for this user's SQL on this connection, if there is one.
+        """
+        with self._lock:
+            kept = self._cursors.pop(self.key(connection, user_id, sql, params), None)
+        if kept is not None:
+            with kept.lock:
+                kept.close()
+
+    def _remove(self, key, kept):
+        with self._lock:
+            if self._cursors.get(key) is kept:
+                del self._cursors[key]
+
+    def close_idle(self):
+        now = time()
+        closing = []
+        with self._lock:
+            by_age = sorted(self._cursors.items(), key=lambda item: item[1].last_used)
+            excess = len(by_age) - app_settings.EXPLORER_PAGING_CURSOR_MAX
+            for i, (key, kept) in enumerate(by_age):
+                expired = now - kept.last_used > app_settings.EXPLORER_PAGING_CURSOR_TTL
+                if (expired or i < excess) and kept.lock.acquire(blocking=False):
+                    del self._cursors[key]
+                    closing.append(kept)
+        for kept in closing:
+            kept.close()
+            kept.lock.release()
+
+    def _reap(self):
+        while True:
+            sleep(max(app_settings.EXPLORER_PAGING_CURSOR_TTL / 2, 1))
+            self.close_idle()
+
+    def close_all(self):
+        with self._lock:
+            cursors = list(self._cursors.values())
+            self._cursors.clear()
+        for kept in cursors:
+            with kept.lock:
+                kept.close()
+
+    def get(self, key):
+        return self._cursors.get(key)
+
+
+kept_cursors = KeptCursors()
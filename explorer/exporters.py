@@ -1,6 +1,7 @@
 import json
 import string
 import sys
+import tempfile
 import uuid
 from datetime import datetime
 
@@ -10,6 +11,8 @@ from django.utils.text import slugify
 from six import BytesIO, StringIO
 
 from explorer import app_settings
+from explorer.models import POSTGRES_VENDOR
+from explorer.utils import get_valid_connection
 
 
 PY3 = sys.version_info[0] == 3
@@ -18,6 +21,8 @@ if PY3:
 else:
     import unicodecsv as csv
 
+STREAMING_CHUNK_SIZE = 64 * 1024
+
 
 def get_exporter_class(format):
     class_str = dict(getattr(app_settings, 'EXPLORER_DATA_EXPORTERS'))[format]
@@ -30,8 +35,13 @@ class BaseExporter(object):
     content_type = ''
     file_extension = ''
 
-    def __init__(self, query):
+    def __init__(self, query, run_by_user_id=None):
+        """
+        :param run_by_user_id: The user whose limit on concurrent queries the export counts
+         towards.
+        """
         self.query = query
+        self.run_by_user_id = run_by_user_id
 
     def get_output(self, **kwargs):
         value = self.get_file_output(**kwargs).getvalue()
@@ -42,7 +52,10 @@ class BaseExporter(object):
 
     def get_file_output(self, **kwargs):
         res = self.query.execute(
-            1, app_settings.EXPLORER_DEFAULT_DOWNLOAD_ROWS, app_settings.EXPLORER_QUERY_TIMEOUT_MS
+            1,
+            app_settings.EXPLORER_DEFAULT_DOWNLOAD_ROWS,
+            app_settings.EXPLORER_QUERY_TIMEOUT_MS,
+            run_by_user_id=self.run_by_user_id,
         )
         return self._get_output(res, **kwargs)
 
@@ -54,6 +67,28 @@ class BaseExporter(object):
         """
         raise NotImplementedError
 
+    def get_streaming_output(self, **kwargs):
+        res = self.query.execute_streaming(
+            app_settings.EXPLORER_QUERY_TIMEOUT_MS,
+            app_settings.EXPLORER_STREAMING_FETCH_SIZE,
+            run_by_user_id=self.run_by_user_id,
+        )
+        return self._close_after(res, self._get_streaming_output(res, **kwargs))
+
+    def _close_after(self, res, output):
+        try:
+            yield from output
+        finally:
+            res.close()
+
+    def _get_streaming_output(self, res, **kwargs):
+        """
+        :param res: StreamingQueryResult
+        :param kwargs: Optional. Any exporter-specific arguments.
+        :return: Iterator of str or bytes chunks
+        """
+        raise NotImplementedError
+
     def get_filename(self):
         # build list of valid chars, build filename from title and replace spaces
         valid_chars = '-_.() %s%s' % (string.ascii_letters, string.digits)
@@ -69,19 +104,49 @@ class CSVExporter(BaseExporter):
     file_extension = '.csv'
 
     def _get_output(self, res, **kwargs):
-        delim = kwargs.get('delim') or app_settings.CSV_DELIMETER
-        delim = '\t' if delim == 'tab' else str(delim)
-        delim = app_settings.CSV_DELIMETER if len(delim) > 1 else delim
         csv_data = StringIO()
-        if PY3:
-            writer = csv.writer(csv_data, delimiter=delim)
-        else:
-            writer = csv.writer(csv_data, delimiter=delim, encoding='utf-8')
+        writer = self._get_writer(csv_data, **kwargs)
         writer.writerow(res.headers)
         for row in res.data:
             writer.writerow([s for s in row])
         return csv_data
 
+    def get_streaming_output(self, **kwargs):
+        delim = self._get_delimiter(**kwargs)
+        connection = get_valid_connection(self.query.connection)
+        if (
+            app_settings.EXPLORER_CSV_COPY_EXPORTS
+            and connection.vendor == POSTGRES_VENDOR
+            and len(delim.encode('utf-8')) == 1
+        ):
+            # COPY only accepts single-byte delimiters
+            res = self.query.execute_csv_copy(
+                app_settings.EXPLORER_QUERY_TIMEOUT_MS, delim, run_by_user_id=self.run_by_user_id
+            )
+            return self._close_after(res, res.chunks())
+        return super().get_streaming_output(**kwargs)
+
+    def _get_streaming_output(self, res, **kwargs):
+        csv_data = StringIO()
+        writer = self._get_writer(csv_data, **kwargs)
+        writer.writerow(res.headers)
+        for batch in res.batches():
+            writer.writerows(batch)
+            yield csv_data.getvalue()
+            csv_data.seek(0)
+            csv_data.truncate()
+
+    def _get_delimiter(self, **kwargs):
+        delim = kwargs.get('delim') or app_settings.CSV_DELIMETER
+        delim = '\t' if delim == 'tab' else str(delim)
+        return app_settings.CSV_DELIMETER if len(delim) > 1 else delim
+
+    def _get_writer(self, csv_data, **kwargs):
+        delim = self._get_delimiter(**kwargs)
+        if PY3:
+            return csv.writer(csv_data, delimiter=delim)
+        return csv.writer(csv_data, delimiter=delim, encoding='utf-8')
+
 
 class JSONExporter(BaseExporter):
 
@@ -97,6 +162,19 @@ class JSONExporter(BaseExporter):
         json_data = json.dumps(data, cls=DjangoJSONEncoder)
         return StringIO(json_data)
 
+    def _get_streaming_output(self, res, **kwargs):
+        # Produces the same document as _get_output, one batch of rows at a time
+        headers = [str(h) if h is not None else '' for h in res.headers]
+        separator = '['
+        for batch in res.batches():
+            chunk = []
+            for row in batch:
+                chunk.append(separator)
+                chunk.append(json.dumps(dict(zip(headers, row)), cls=DjangoJSONEncoder))
+                separator = ', '
+            yield ''.join(chunk)
+        yield ']' if separator == ', ' else '[]'
+
 
 class ExcelExporter(BaseExporter):
 
@@ -105,11 +183,26 @@ class ExcelExporter(BaseExporter):
     file_extension = '.xlsx'
 
     def _get_output(self, res, **kwargs):
-        import xlsxwriter
-
         output = BytesIO()
+        self._write_workbook(output, res.header_strings, [res.data], {'in_memory': True})
+        return output
 
-        wb = xlsxwriter.Workbook(output, {'in_memory': True})
+    def _get_streaming_output(self, res, **kwargs):
+        # The xlsx zip container can only be assembled once every row has been written, so the
+        # workbook is built in a temporary file, flushing each row to disk as it is written, and
+        # then streamed from there.
+        with tempfile.TemporaryFile() as output:
+            self._write_workbook(
+                output, res.header_strings, res.batches(), {'constant_memory': True}
+            )
+            output.seek(0)
+            for chunk in iter(lambda: output.read(STREAMING_CHUNK_SIZE), b''):
+                yield chunk
+
+    def _write_workbook(self, output, header_strings, batches, options):
+        import xlsxwriter
+
+        wb = xlsxwriter.Workbook(output, options)
 
         ws = wb.add_worksheet(name=self._format_title())
 
@@ -117,30 +210,30 @@ class ExcelExporter(BaseExporter):
         row = 0
         col = 0
         header_style = wb.add_format({'bold': True})
-        for header in res.header_strings:
+        for header in header_strings:
             ws.write(row, col, header, header_style)
             col += 1
 
         # Write data
         row = 1
         col = 0
-        for data_row in res.data:
-            for data in data_row:
-                # xlsxwriter can't handle timezone-aware datetimes or
-                # UUIDs, so we help out here and just cast it to a
-                # string
-                if isinstance(data, datetime) or isinstance(data, uuid.UUID):
-                    data = str(data)
-                # JSON and Array fields
-                if isinstance(data, dict) or isinstance(data, list):
-                    data = json.dumps(data)
-                ws.write(row, col, data)
-                col += 1
-            row += 1
-            col = 0
+        for batch in batches:
+            for data_row in batch:
+                for data in data_row:
+                    # xlsxwriter can't handle timezone-aware datetimes or
+                    # UUIDs, so we help out here and just cast it to a
+                    # string
+                    if isinstance(data, datetime) or isinstance(data, uuid.UUID):
+                        data = str(data)
+                    # JSON and Array fields
+                    if isinstance(data, dict) or isinstance(data, list):
+                        data = json.dumps(data)
+                    ws.write(row, col, data)
+                    col += 1
+                row += 1
+                col = 0
 
         wb.close()
-        return output
 
     def _format_title(self):
         # XLSX writer wont allow sheet names > 31 characters or that contain invalid characters
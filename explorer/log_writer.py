@@ -0,0 +1,82 @@
+import atexit
+import logging
+import threading
+
+from django.db import close_old_connections, DatabaseError
+
+from explorer import app_settings
+from explorer.utils import ProcessThread
+
+logger = logging.getLogger(__name__)
+
+# Query logs are written to the database by a background thread in each process, in batches,
+# when EXPLORER_QUERY_LOG_FLUSH_INTERVAL is set, so that running a query doesn't wait on the
+# write. Logs still waiting to be written are lost if the process is killed, though they are
+# written when it exits normally. Logs that fail to be written are kept for the next flush, up
+# to EXPLORER_QUERY_LOG_MAX_PENDING of them.
+
+
+class QueryLogWriter(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []
+        self._wake = threading.Event()
+        self._flusher = ProcessThread(self._run)
+
+    @property
+    def enabled(self):
+        return app_settings.EXPLORER_QUERY_LOG_FLUSH_INTERVAL > 0
+
+    def save(self, ql):
+        """
+        Save a QueryLog, straight away, or with the next flush when logs are written behind.
+        Logs written behind have no id until then.
+        """
+        from explorer.models import QueryStats
+
+        if not self.enabled:
+            ql.save()
+            QueryStats.record([ql])
+            return
+        with self._lock:
+            self._pending.append(ql)
+            pending = len(self._pending)
+        self._flusher.start()
+        if pending >= app_settings.EXPLORER_QUERY_LOG_BATCH_SIZE:
+            self._wake.set()
+
+    def flush(self):
+        from explorer.models import QueryLog, QueryStats
+
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        try:
+            QueryLog.objects.bulk_create(
+                pending, batch_size=app_settings.EXPLORER_QUERY_LOG_BATCH_SIZE
+            )
+        except DatabaseError:
+            logger.exception('Failed to write %s query logs', len(pending))
+            with self._lock:
+                self._pending = pending + self._pending
+                dropped = len(self._pending) - app_settings.EXPLORER_QUERY_LOG_MAX_PENDING
+                if dropped > 0:
+                    logger.warning('Dropping %s query logs that could not be written', dropped)
+                    del self._pending[:dropped]
+            return
+        try:
+            QueryStats.record(pending)
+        except DatabaseError:
+            logger.exception('Failed to add %s query logs to query stats', len(pending))
+
+    def _run(self):
+        while True:
+            self._wake.wait(app_settings.EXPLORER_QUERY_LOG_FLUSH_INTERVAL)
+            self._wake.clear()
+            close_old_connections()
+            self.flush()
+
+
+log_writer = QueryLogWriter()
+atexit.register(log_writer.flush)
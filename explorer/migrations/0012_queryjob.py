@@ -0,0 +1,69 @@
+# Generated by Django 3.0.7 on 2026-10-18 17:14
+
+import uuid
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('explorer', '0011_remove_query_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryJob',
+            fields=[
+                (
+                    'id',
+                    models.UUIDField(
+                        default=uuid.uuid4, editable=False, primary_key=True, serialize=False
+                    ),
+                ),
+                ('sql', models.TextField()),
+                ('connection', models.CharField(blank=True, max_length=128, null=True)),
+                ('page', models.PositiveIntegerField(default=1)),
+                ('limit', models.PositiveIntegerField()),
+                (
+                    'status',
+                    models.CharField(
+                        choices=[
+                            ('pending', 'Pending'),
+                            ('running', 'Running'),
+                            ('succeeded', 'Succeeded'),
+                            ('failed', 'Failed'),
+                            ('cancelled', 'Cancelled'),
+                        ],
+                        default='pending',
+                        max_length=16,
+                    ),
+                ),
+                ('error', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                (
+                    'query_log',
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to='explorer.QueryLog',
+                    ),
+                ),
+                (
+                    'run_by_user',
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={'ordering': ['-created_at'],},
+        ),
+    ]
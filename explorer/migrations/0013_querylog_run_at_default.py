@@ -0,0 +1,19 @@
+# Generated by Django 3.0.7 on 2026-10-18 17:37
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0012_queryjob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='querylog',
+            name='run_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
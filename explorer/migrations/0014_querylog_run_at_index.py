@@ -0,0 +1,22 @@
+# Generated by Django 3.0.7 on 2026-10-18 17:38
+
+from django.db import migrations, models
+
+from explorer.migrations._operations import AddIndexConcurrentlyOnPostgres
+
+
+class Migration(migrations.Migration):
+
+    # The log table can be large, so the index is built without locking it against writes
+    atomic = False
+
+    dependencies = [
+        ('explorer', '0013_querylog_run_at_default'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='querylog',
+            index=models.Index(fields=['run_at'], name='explorer_qu_run_at_619063_idx'),
+        ),
+    ]
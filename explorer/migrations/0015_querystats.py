@@ -0,0 +1,82 @@
+# Generated by Django 3.0.7 on 2026-10-18 17:40
+
+import math
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+HISTOGRAM_BUCKETS = 50
+
+
+def fill_query_stats(apps, schema_editor):
+    # As QueryStats.add would have for every log written so far, one query at a time
+    QueryLog = apps.get_model('explorer', 'QueryLog')
+    QueryStats = apps.get_model('explorer', 'QueryStats')
+    logs = (
+        QueryLog.objects.filter(query_id__isnull=False)
+        .order_by('query_id')
+        .values_list('query_id', 'run_at', 'duration')
+    )
+    stats = None
+    histogram = None
+    batch = []
+    for query_id, run_at, duration in logs.iterator():
+        if stats is None or stats.query_id != query_id:
+            if stats is not None:
+                stats.duration_histogram = ','.join(str(n) for n in histogram)
+                batch.append(stats)
+            stats = QueryStats(query_id=query_id)
+            histogram = [0] * HISTOGRAM_BUCKETS
+        stats.run_count += 1
+        if stats.last_run_at is None or run_at > stats.last_run_at:
+            stats.last_run_at = run_at
+        if duration is not None:
+            stats.finished_count += 1
+            stats.total_duration += duration
+            bucket = 0 if duration <= 1 else math.ceil(2 * math.log2(duration))
+            histogram[min(bucket, HISTOGRAM_BUCKETS - 1)] += 1
+        if len(batch) >= 1000:
+            QueryStats.objects.bulk_create(batch)
+            batch = []
+    if stats is not None:
+        stats.duration_histogram = ','.join(str(n) for n in histogram)
+        batch.append(stats)
+    QueryStats.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0014_querylog_run_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryStats',
+            fields=[
+                (
+                    'query',
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name='stats',
+                        serialize=False,
+                        to='explorer.Query',
+                    ),
+                ),
+                ('run_count', models.PositiveIntegerField(default=0)),
+                ('last_run_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_count', models.PositiveIntegerField(default=0)),
+                ('total_duration', models.FloatField(default=0)),
+                ('total_rows', models.BigIntegerField(default=0)),
+                ('duration_histogram', models.TextField(blank=True, default='')),
+            ],
+            options={'verbose_name_plural': 'Query stats',},
+        ),
+        migrations.AddField(
+            model_name='querylog',
+            name='row_count',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_query_stats, migrations.RunPython.noop),
+    ]
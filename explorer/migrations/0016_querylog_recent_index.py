@@ -0,0 +1,23 @@
+# Generated by Django 3.0.7 on 2026-10-18 17:42
+
+from django.db import migrations, models
+
+from explorer.migrations._operations import AddIndexConcurrentlyOnPostgres
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('explorer', '0015_querystats'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='querylog',
+            index=models.Index(
+                fields=['run_by_user', 'query', '-run_at'], name='explorer_qu_run_by__984fa0_idx'
+            ),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.0.7 on 2026-10-18 17:50
+
+from django.db import migrations
+
+from explorer.migrations._operations import has_pg_trgm
+
+# The query list searches with icontains, which Postgres compares as UPPER(column) LIKE, so the
+# indexes are on those expressions. They need the pg_trgm extension, and searches are left to
+# scan the table where it isn't available.
+
+SEARCH_INDEXES = {
+    'explorer_query_title_trgm': 'title',
+    'explorer_query_description_trgm': 'description',
+}
+
+
+def create_search_indexes(apps, schema_editor):
+    if not has_pg_trgm(schema_editor):
+        return
+    table = schema_editor.quote_name(apps.get_model('explorer', 'Query')._meta.db_table)
+    for name, column in SEARCH_INDEXES.items():
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS %s ON %s USING gin (UPPER(%s) gin_trgm_ops)'
+            % (schema_editor.quote_name(name), table, schema_editor.quote_name(column))
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in SEARCH_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS %s' % schema_editor.quote_name(name))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0016_querylog_recent_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 3.0.7 on 2026-10-18 17:58
+
+from django.db import migrations, models
+
+from explorer.migrations._operations import AddIndexConcurrentlyOnPostgres, has_pg_trgm
+
+# The log view searches the logged SQL with icontains, which Postgres compares as UPPER(sql)
+# LIKE, so the trigram index is on that expression, where the pg_trgm extension is available.
+
+SQL_SEARCH_INDEX = 'explorer_querylog_sql_trgm'
+
+
+def create_sql_search_index(apps, schema_editor):
+    if not has_pg_trgm(schema_editor):
+        return
+    table = apps.get_model('explorer', 'QueryLog')._meta.db_table
+    schema_editor.execute(
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS %s ON %s USING gin (UPPER(sql) gin_trgm_ops)'
+        % (schema_editor.quote_name(SQL_SEARCH_INDEX), schema_editor.quote_name(table))
+    )
+
+
+def drop_sql_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'DROP INDEX CONCURRENTLY IF EXISTS %s' % schema_editor.quote_name(SQL_SEARCH_INDEX)
+    )
+
+
+class Migration(migrations.Migration):
+
+    # The log table can be large, so the indexes are built without locking it against writes
+    atomic = False
+
+    dependencies = [
+        ('explorer', '0017_query_search_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='querylog',
+            index=models.Index(fields=['query', '-run_at'], name='explorer_qu_query_i_f4b03b_idx'),
+        ),
+        migrations.RunPython(create_sql_search_index, drop_sql_search_index),
+    ]
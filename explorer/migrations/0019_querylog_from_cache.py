@@ -0,0 +1,16 @@
+# Generated by Django 3.0.7 on 2026-10-18 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0018_querylog_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='querylog', name='from_cache', field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 3.0.7 on 2026-10-18 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0019_querylog_from_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queryjob', name='params', field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.0.7 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0020_queryjob_params'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='query',
+            name='result_cache_ttl',
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text="Seconds to cache the results of this query for. Will use"
+                " EXPLORER_RESULT_CACHE_TTL if left blank, and 0 doesn't cache them",
+                null=True,
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.0.7 on 2026-10-18 18:28
+
+from django.db import migrations, models
+
+from explorer.migrations._operations import AddIndexConcurrentlyOnPostgres
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('explorer', '0021_query_result_cache_ttl'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='queryjob',
+            index=models.Index(fields=['created_at'], name='explorer_qu_created_c63fa5_idx'),
+        ),
+    ]
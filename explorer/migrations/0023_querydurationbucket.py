@@ -0,0 +1,75 @@
+# Generated by Django 3.0.7 on 2026-10-18 18:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+HISTOGRAM_BUCKETS = 50
+
+
+def split_histograms(apps, schema_editor):
+    db = schema_editor.connection.alias
+    QueryStats = apps.get_model('explorer', 'QueryStats')
+    QueryDurationBucket = apps.get_model('explorer', 'QueryDurationBucket')
+    batch = []
+    histograms = (
+        QueryStats.objects.using(db)
+        .exclude(duration_histogram='')
+        .values_list('query_id', 'duration_histogram')
+    )
+    for query_id, histogram in histograms.iterator():
+        for bucket, count in enumerate(histogram.split(',')):
+            if count and int(count):
+                batch.append(QueryDurationBucket(stats_id=query_id, bucket=bucket, count=count))
+        if len(batch) >= 1000:
+            QueryDurationBucket.objects.using(db).bulk_create(batch)
+            batch = []
+    QueryDurationBucket.objects.using(db).bulk_create(batch)
+
+
+def join_histograms(apps, schema_editor):
+    db = schema_editor.connection.alias
+    QueryStats = apps.get_model('explorer', 'QueryStats')
+    QueryDurationBucket = apps.get_model('explorer', 'QueryDurationBucket')
+    histograms = {}
+    for query_id, bucket, count in (
+        QueryDurationBucket.objects.using(db).values_list('stats_id', 'bucket', 'count').iterator()
+    ):
+        histograms.setdefault(query_id, [0] * HISTOGRAM_BUCKETS)[bucket] = count
+    for query_id, histogram in histograms.items():
+        QueryStats.objects.using(db).filter(query_id=query_id).update(
+            duration_histogram=','.join(str(n) for n in histogram)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('explorer', '0022_queryjob_created_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QueryDurationBucket',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True, primary_key=True, serialize=False, verbose_name='ID'
+                    ),
+                ),
+                ('bucket', models.PositiveSmallIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                (
+                    'stats',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name='duration_buckets',
+                        to='explorer.QueryStats',
+                    ),
+                ),
+            ],
+            options={'unique_together': {('stats', 'bucket')},},
+        ),
+        migrations.RunPython(split_histograms, join_histograms),
+        migrations.RemoveField(model_name='querystats', name='duration_histogram',),
+    ]
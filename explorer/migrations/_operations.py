@@ -0,0 +1,46 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import DatabaseError, migrations, transaction
+
+
+class AddIndexConcurrentlyOnPostgres(AddIndexConcurrently):
+    # Other databases, as used in tests, get the index as usual
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_forwards(
+                self, app_label, schema_editor, from_state, to_state
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_backwards(
+                self, app_label, schema_editor, from_state, to_state
+            )
+
+
+def has_pg_trgm(schema_editor):
+    """
+    :return: Whether trigram indexes can be made, creating the pg_trgm extension if need be and
+     the database user may.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return False
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cursor.fetchone() is not None:
+            return True
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return False
+    try:
+        # In a savepoint, so that the migration's transaction survives a failure
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DatabaseError:
+        # Creating an untrusted extension needs a superuser before Postgres 13
+        return False
+    return True
@@ -1,12 +1,25 @@
 from __future__ import unicode_literals
 
+import hashlib
+import json
 import logging
+import math
+import threading
 import uuid
+from collections import Counter
+from contextlib import ExitStack, nullcontext
+from decimal import Decimal
+from itertools import chain
+from queue import Empty, Full, Queue
 from time import time
 
 import six
 from django.conf import settings
-from django.db import DatabaseError, models
+from django.core.cache import cache
+from django.db import DatabaseError, IntegrityError, models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
 
 try:
     from django.urls import reverse
@@ -14,7 +27,15 @@ except ImportError:
     from django.core.urlresolvers import reverse
 from dynamic_models.models import AbstractFieldSchema, AbstractModelSchema  # noqa: I202
 
+from explorer import app_settings
+from explorer.admission import admission
+from explorer.cancellation import running_queries
+from explorer.cursors import kept_cursors
+from explorer.log_writer import log_writer
+from explorer.replicas import replicas
+from explorer.result_cache import result_cache
 from explorer.utils import (
+    bind_params,
     extract_params,
     get_params_for_url,
     get_valid_connection,
@@ -24,6 +45,21 @@ from explorer.utils import (
 
 POSTGRES_VENDOR = 'postgresql'
 
+# Columns of these field types, as cursor.description type codes map to them in the
+# connection's introspection, are summarised with ColumnSummary
+NUMERIC_FIELD_TYPES = {
+    'AutoField',
+    'BigAutoField',
+    'BigIntegerField',
+    'DecimalField',
+    'FloatField',
+    'IntegerField',
+    'PositiveIntegerField',
+    'PositiveSmallIntegerField',
+    'SmallAutoField',
+    'SmallIntegerField',
+}
+
 logger = logging.getLogger(__name__)
 
 
@@ -44,6 +80,12 @@ class Query(models.Model):
         help_text="Name of DB connection (as specified in settings) to use for this query."
         " Will use EXPLORER_DEFAULT_CONNECTION if left blank",
     )
+    result_cache_ttl = models.PositiveIntegerField(
+        blank=True,
+        null=True,
+        help_text="Seconds to cache the results of this query for. Will use"
+        " EXPLORER_RESULT_CACHE_TTL if left blank, and 0 doesn't cache them",
+    )
 
     def __init__(self, *args, **kwargs):
         self.params = kwargs.get('params')
@@ -58,31 +100,120 @@ class Query(models.Model):
         return six.text_type(self.title)
 
     def get_run_count(self):
-        return self.querylog_set.count()
+        stats = QueryStats.objects.filter(query_id=self.id).first()
+        return stats.run_count if stats else 0
 
     def avg_duration(self):
-        return self.querylog_set.aggregate(models.Avg('duration'))['duration__avg']
+        stats = QueryStats.objects.filter(query_id=self.id).first()
+        return stats.avg_duration if stats else None
 
     def final_sql(self):
         return swap_params(self.sql, self.available_params())
 
-    def execute_with_logging(self, executing_user, page, limit, timeout):
-        ql = self.log(executing_user)
-        ret = self.execute(page, limit, timeout)
-        ql.duration = ret.duration
-        ql.save()
+    def touch(self):
+        """
+        Update last_run_date, and nothing else, unless it has been updated in the last
+        EXPLORER_QUERY_TOUCH_INTERVAL seconds, so that viewing a query rarely writes to it.
+        """
+        interval = app_settings.EXPLORER_QUERY_TOUCH_INTERVAL
+        if interval <= 0 or cache.add('_explorer_query_touched_%s' % self.id, True, interval):
+            Query.objects.filter(pk=self.pk).update(last_run_date=timezone.now())
+
+    def bound_sql(self):
+        """
+        :return: The SQL to run, with the values of its params, as returned by bind_params.
+        """
+        return bind_params(self.sql, self.available_params())
+
+    def execute_with_logging(
+        self,
+        executing_user,
+        page,
+        limit,
+        timeout,
+        reuse_cursor=False,
+        refresh_cache=False,
+        execution_id=None,
+    ):
+        # The log is written once the query has finished, with its duration, rather than being
+        # written before the query and updated after it
+        ql = self.log(executing_user, save=False)
+        try:
+            ret = self.execute(
+                page, limit, timeout, executing_user, reuse_cursor, refresh_cache, execution_id
+            )
+            ql.set_result(ret)
+        finally:
+            log_writer.save(ql)
         return ret, ql
 
-    def execute(self, page, limit, timeout):
-        result = QueryResult(
-            self.final_sql(),
-            get_valid_connection(self.connection),
+    def execute(
+        self,
+        page,
+        limit,
+        timeout,
+        executing_user=None,
+        reuse_cursor=False,
+        refresh_cache=False,
+        execution_id=None,
+        run_by_user_id=None,
+    ):
+        """
+        :param executing_user: The user whose cursor is kept open for reuse_cursor, if
+         EXPLORER_PAGING_CURSOR_TTL is set.
+        :param reuse_cursor: Fetch the page from the cursor kept for the same SQL by the same
+         user, declaring it if it isn't kept yet, so that the pages after it can be fetched
+         without running the query again.
+        :param refresh_cache: Run the query even if its result is in the result cache, and
+         cache the new result in its place.
+        :param execution_id: Register the query under this id while it runs, so that it can be
+         cancelled with explorer.cancellation.running_queries.
+        :param run_by_user_id: The user whose limit on concurrent queries the query counts
+         towards, if not executing_user.
+        :raises explorer.admission.QueryRejected: When the query would run over a limit on
+         concurrent queries for too long. Results served from the result cache take no part in
+         the limits.
+        """
+        connection = get_valid_connection(self.connection)
+        user_id = getattr(executing_user, 'pk', None)
+        sql, params = self.bound_sql()
+        return QueryResult(
+            sql,
+            connection,
             page,
             limit=limit,
             timeout=timeout,
+            user_id=user_id,
+            reuse_cursor=reuse_cursor,
+            count_threshold=app_settings.EXPLORER_EXACT_COUNT_THRESHOLD,
+            refresh_cache=refresh_cache,
+            execution_id=execution_id,
+            params=params,
+            run_by_user_id=run_by_user_id,
+            cache_ttl=self.result_cache_ttl,
+        )
+
+    def execute_streaming(self, timeout, fetch_size, run_by_user_id=None):
+        sql, params = self.bound_sql()
+        return StreamingQueryResult(
+            sql,
+            get_valid_connection(self.connection),
+            timeout,
+            fetch_size,
+            params=params,
+            run_by_user_id=run_by_user_id,
+        )
+
+    def execute_csv_copy(self, timeout, delimiter, run_by_user_id=None):
+        sql, params = self.bound_sql()
+        return CopyQueryResult(
+            sql,
+            get_valid_connection(self.connection),
+            timeout,
+            delimiter,
+            params=params,
+            run_by_user_id=run_by_user_id,
         )
-        result.process()
-        return result
 
     def available_params(self):
         """
@@ -105,7 +236,11 @@ class Query(models.Model):
     def params_for_url(self):
         return get_params_for_url(self)
 
-    def log(self, user=None):
+    def log(self, user=None, save=True):
+        """
+        :param save: Save the log before returning it. Otherwise it's left to the caller to save,
+         for example with explorer.log_writer.log_writer.
+        """
         if user:
             # In Django<1.10, is_anonymous was a method.
             try:
@@ -117,7 +252,9 @@ class Query(models.Model):
         ql = QueryLog(
             sql=self.final_sql(), query_id=self.id, run_by_user=user, connection=self.connection
         )
-        ql.save()
+        if save:
+            ql.save()
+            QueryStats.record([ql])
         return ql
 
 
@@ -128,41 +265,482 @@ class QueryLog(models.Model):
     run_by_user = models.ForeignKey(
         settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE
     )
-    run_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add, as logs written behind in bulk must keep the time they were made at
+    run_at = models.DateTimeField(default=timezone.now, editable=False)
     duration = models.FloatField(blank=True, null=True)  # milliseconds
     connection = models.CharField(blank=True, null=True, max_length=128)
+    row_count = models.BigIntegerField(blank=True, null=True)
+    # Served from the result cache, so not a run of the query, and left out of its stats
+    from_cache = models.BooleanField(default=False)
 
     @property
     def is_playground(self):
         return self.query_id is None
 
+    def set_result(self, res):
+        """
+        Record the QueryResult of the run, with no duration if it came from the result cache.
+        """
+        self.from_cache = res.from_cache
+        self.duration = None if res.from_cache else res.duration
+        self.row_count = res.row_count
+
     class Meta:
         ordering = ['-run_at']
+        indexes = [
+            models.Index(fields=['run_at']),
+            models.Index(fields=['run_by_user', 'query', '-run_at']),
+            models.Index(fields=['query', '-run_at']),
+        ]
+
+
+class QueryStats(models.Model):
+    """
+    Statistics of the runs of a saved query, added to as its logs are written so that they can
+    be read without aggregating the log. Durations are counted in a histogram of buckets whose
+    bounds grow by a factor of sqrt(2), kept as QueryDurationBuckets, from which their
+    percentiles are estimated.
+    """
+
+    HISTOGRAM_BUCKETS = 50
+
+    query = models.OneToOneField(
+        Query, primary_key=True, related_name='stats', on_delete=models.CASCADE
+    )
+    run_count = models.PositiveIntegerField(default=0)
+    last_run_at = models.DateTimeField(blank=True, null=True)
+    # Runs that finished, and so have a duration and a row count
+    finished_count = models.PositiveIntegerField(default=0)
+    total_duration = models.FloatField(default=0)  # milliseconds
+    total_rows = models.BigIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = 'Query stats'
+
+    @classmethod
+    def record(cls, logs):
+        """
+        Add the runs recorded by logs that have just been written to the stats of their queries.
+        """
+        runs = {}
+        for ql in logs:
+            if ql.query_id and not ql.from_cache:
+                runs.setdefault(ql.query_id, []).append(ql)
+        for query_id, query_logs in runs.items():
+            cls._add(query_id, query_logs)
+
+    @classmethod
+    def _add(cls, query_id, logs):
+        # Each row is changed by an UPDATE that adds to its counts, rather than being read and
+        # written back while locked, so concurrent runs of a query only wait for each other for
+        # as long as the UPDATE takes
+        finished = [ql for ql in logs if ql.duration is not None]
+        last_run_at = Value(max(ql.run_at for ql in logs), output_field=models.DateTimeField())
+        _update_or_insert(
+            cls.objects.filter(query_id=query_id),
+            {'query_id': query_id},
+            run_count=F('run_count') + len(logs),
+            last_run_at=Greatest(Coalesce('last_run_at', last_run_at), last_run_at),
+            finished_count=F('finished_count') + len(finished),
+            total_duration=F('total_duration') + sum(ql.duration for ql in finished),
+            total_rows=F('total_rows') + sum(ql.row_count or 0 for ql in finished),
+        )
+        for bucket, count in Counter(cls.bucket(ql.duration) for ql in finished).items():
+            _update_or_insert(
+                QueryDurationBucket.objects.filter(stats_id=query_id, bucket=bucket),
+                {'stats_id': query_id, 'bucket': bucket},
+                count=F('count') + count,
+            )
+
+    @classmethod
+    def bucket(cls, duration):
+        if duration <= 1:
+            return 0
+        return min(math.ceil(2 * math.log2(duration)), cls.HISTOGRAM_BUCKETS - 1)
+
+    @property
+    def histogram(self):
+        counts = [0] * self.HISTOGRAM_BUCKETS
+        for bucket, count in self.duration_buckets.values_list('bucket', 'count'):
+            counts[bucket] = count
+        return counts
+
+    @property
+    def avg_duration(self):
+        return self.total_duration / self.finished_count if self.finished_count else None
+
+    @property
+    def avg_rows(self):
+        return self.total_rows / self.finished_count if self.finished_count else None
+
+    def duration_percentile(self, percent):
+        """
+        :return: The upper bound in ms of the bucket that the given percentile of the durations
+         falls into, or None if no run has finished.
+        """
+        if not self.finished_count:
+            return None
+        target = self.finished_count * percent / 100
+        seen = 0
+        for i, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= target:
+                return 2 ** (i / 2)
+        return None
+
+
+class QueryDurationBucket(models.Model):
+    """
+    How many of the finished runs of a query took a duration in one bucket of the histogram of
+    its QueryStats.
+    """
+
+    stats = models.ForeignKey(QueryStats, related_name='duration_buckets', on_delete=models.CASCADE)
+    bucket = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [('stats', 'bucket')]
+
+
+def _update_or_insert(queryset, fields, **changes):
+    """
+    Update the row of queryset with changes, inserting it with fields first if there is none.
+    """
+    if queryset.update(**changes):
+        return
+    try:
+        with transaction.atomic(using=queryset.db):
+            queryset.model.objects.create(**fields)
+    except IntegrityError:
+        # It was inserted by a concurrent run in the meantime
+        pass
+    queryset.update(**changes)
+
+
+class QueryJob(models.Model):
+    """
+    A run of a query by a Celery worker, so that the web request that asked for it doesn't wait
+    for the query to finish. The page of results is kept in the Django cache for
+    EXPLORER_QUERY_JOB_RESULT_TTL seconds.
+    """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+        (CANCELLED, 'Cancelled'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # The SQL as written, with the values of its $$params$$ kept apart as JSON, so that they are
+    # bound when the job runs as they are for queries run by a web request
+    sql = models.TextField()
+    params = models.TextField(blank=True, default='')
+    connection = models.CharField(blank=True, null=True, max_length=128)
+    query_log = models.ForeignKey(QueryLog, null=True, blank=True, on_delete=models.SET_NULL)
+    run_by_user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.CASCADE
+    )
+    page = models.PositiveIntegerField(default=1)
+    limit = models.PositiveIntegerField()
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['created_at'])]
+
+    @classmethod
+    def submit(cls, query, user, page, limit, refresh_cache=False):
+        from explorer.tasks import execute_query_job
+
+        # The run is added to the query's stats once the job has run, with its duration
+        ql = query.log(user, save=False)
+        ql.save()
+        job = cls.objects.create(
+            sql=query.sql,
+            params=json.dumps(query.available_params()),
+            connection=query.connection,
+            query_log=ql,
+            run_by_user=ql.run_by_user,
+            page=page,
+            limit=limit,
+        )
+        transaction.on_commit(lambda: execute_query_job.delay(str(job.id), refresh_cache))
+        return job
+
+    @property
+    def is_finished(self):
+        return self.status not in (self.PENDING, self.RUNNING)
+
+    @property
+    def result_cache_key(self):
+        return '_explorer_query_job_%s' % self.id
+
+    def query(self, title=''):
+        return Query(
+            sql=self.sql,
+            title=title,
+            connection=self.connection,
+            params=json.loads(self.params) if self.params else None,
+        )
+
+    def run(self, refresh_cache=False):
+        # Each change of status only applies to a job in the status expected, so a job that is
+        # cancelled while it waits or runs stays cancelled, and its result is thrown away
+        if not self._set_status(self.RUNNING, self.PENDING):
+            return
+        query = self.query()
+        res = None
+        try:
+            res = query.execute(
+                self.page,
+                self.limit,
+                app_settings.EXPLORER_QUERY_TIMEOUT_MS,
+                refresh_cache=refresh_cache,
+                execution_id=str(self.id),
+                run_by_user_id=self.run_by_user_id,
+            )
+            cache.set(
+                self.result_cache_key,
+                res._cache_entry(),
+                app_settings.EXPLORER_QUERY_JOB_RESULT_TTL,
+            )
+            self._set_status(self.SUCCEEDED, self.RUNNING)
+        except DatabaseError as e:
+            self._set_status(self.FAILED, self.RUNNING, error=str(e))
+        except Exception as e:
+            # Anything else is a fault in the worker rather than the query, but the job mustn't
+            # be left running for the page waiting on it
+            self._set_status(self.FAILED, self.RUNNING, error=str(e))
+            raise
+        finally:
+            self._record_run(res)
+
+    def _record_run(self, res):
+        # As execute_with_logging does for a query run by a web request
+        ql = QueryLog.objects.filter(pk=self.query_log_id).first() if self.query_log_id else None
+        if ql is None:
+            return
+        if res is not None:
+            ql.set_result(res)
+            ql.save(update_fields=['duration', 'row_count', 'from_cache'])
+        QueryStats.record([ql])
+
+    def cancel(self):
+        if not self._set_status(self.CANCELLED, self.PENDING, self.RUNNING):
+            return False
+        running_queries.cancel(str(self.id), check_user=False)
+        return True
+
+    def _set_status(self, status, *expected, error=None):
+        finished_at = None if status == self.RUNNING else timezone.now()
+        updated = QueryJob.objects.filter(pk=self.pk, status__in=expected).update(
+            status=status, error=error, finished_at=finished_at
+        )
+        if updated:
+            self.status, self.error, self.finished_at = status, error, finished_at
+        return bool(updated)
+
+    def result(self):
+        """
+        :return: The QueryResult of a job that succeeded, or None if it has not succeeded or its
+         result has expired.
+        """
+        entry = cache.get(self.result_cache_key) if self.status == self.SUCCEEDED else None
+        if entry is None:
+            return None
+        sql, params = self.query().bound_sql()
+        res = QueryResult(
+            sql,
+            get_valid_connection(self.connection),
+            self.page,
+            self.limit,
+            app_settings.EXPLORER_QUERY_TIMEOUT_MS,
+            cache_entry=entry,
+            params=params,
+            run_by_user_id=self.run_by_user_id,
+        )
+        res.cache_key = self.result_cache_key
+        return res
 
 
 class QueryResult(object):
-    def __init__(self, sql, connection, page, limit, timeout):
+    def __init__(
+        self,
+        sql,
+        connection,
+        page,
+        limit,
+        timeout,
+        user_id=None,
+        reuse_cursor=False,
+        count_threshold=None,
+        refresh_cache=False,
+        cache_entry=None,
+        execution_id=None,
+        params=None,
+        run_by_user_id=None,
+        cache_ttl=None,
+    ):
+        """
+        :param cache_entry: A result saved by _cache_entry, to be used instead of running the
+         query.
+        :param params: Values to bind to the %s placeholders of the SQL.
+        :param run_by_user_id: The user whose limit on concurrent queries the query counts
+         towards, if not user_id.
+        :param cache_ttl: Seconds to keep the result in the result cache for, if not
+         EXPLORER_RESULT_CACHE_TTL.
+        """
         self.sql = sql
+        self.params = params or []
         self.connection = connection
         self.limit = limit
         self.timeout = timeout
+        self.user_id = user_id
+        self.reuse_cursor = reuse_cursor
+        self.count_threshold = count_threshold
+        self.refresh_cache = refresh_cache
+        self.execution_id = execution_id
+        self.run_by_user_id = run_by_user_id or user_id
+        self.cache_ttl = cache_ttl
+        # Where the page is cached, if anywhere, for keep_for_stats
+        self.cache_key = None
+        self.from_cache = False
+        self.stats_cover_full_result = False
         self._row_count = None
+        self.row_count_is_estimate = False
         self._data = []
         self._headers = []
         self._summary = {}
         self._description = None
         self.duration = None
         self.page = page
-        self.execute_query()
+        if cache_entry is None:
+            self.execute_query()
+        else:
+            self._load_cache_entry(cache_entry)
 
     def execute_query(self):
-        with self.connection.cursor() as cursor:
-            sql_query = SQLQuery(cursor, self.sql, self.limit, self.page, self.timeout)
-            self._data = sql_query.get_results()
-            self._description = sql_query.description
-            self._headers = self._get_headers()
-            self._row_count = sql_query.count
-            self.duration = sql_query.duration
+        if result_cache.ttl(self.cache_ttl) <= 0:
+            self._execute_query()
+            return
+        key = result_cache.key(self.connection, self.sql, self.page, self.limit, self.params)
+        self.cache_key = key
+        entry = None if self.refresh_cache else result_cache.get(key)
+        if entry is None:
+            self._execute_query()
+            result_cache.set(key, self._cache_entry(), self.cache_ttl)
+        else:
+            self._load_cache_entry(entry)
+            self.from_cache = True
+
+    def _cache_entry(self):
+        return {
+            'data': self.data,
+            'description': [tuple(d) for d in self._description or []],
+            'row_count': self.row_count,
+            'row_count_is_estimate': self.row_count_is_estimate,
+            'duration': self.duration,
+        }
+
+    def keep_for_stats(self, user_id):
+        """
+        Keep a reference to the page for EXPLORER_STATS_PAGE_TTL seconds, so that its column
+        statistics can be computed later by user_id. The page itself is only kept where it is
+        already cached, by the result cache or a query job, and is fetched again otherwise.
+
+        :return: The id to pass to kept_for_stats.
+        """
+        ref = {
+            'sql': self.sql,
+            'params': self.params,
+            'connection': self.connection.alias,
+            'page': self.page,
+            'limit': self.limit,
+            'timeout': self.timeout,
+            'cache_key': self.cache_key,
+        }
+        return result_cache.keep_for_stats(ref, user_id)
+
+    @classmethod
+    def kept_for_stats(cls, stats_id, user_id):
+        """
+        :return: The QueryResult kept by keep_for_stats, or None if it has expired or was kept
+         for another user. The page is run again if it is no longer cached.
+        """
+        ref = result_cache.kept_for_stats(stats_id, user_id)
+        if ref is None:
+            return None
+        return cls(
+            ref['sql'],
+            get_valid_connection(ref['connection']),
+            ref['page'],
+            ref['limit'],
+            ref['timeout'],
+            cache_entry=cache.get(ref['cache_key']) if ref['cache_key'] else None,
+            params=ref['params'],
+            run_by_user_id=user_id,
+        )
+
+    def _load_cache_entry(self, entry):
+        self._data = entry['data']
+        self._description = entry['description']
+        self._headers = self._get_headers()
+        self._row_count = entry['row_count']
+        self.row_count_is_estimate = entry['row_count_is_estimate']
+        self.duration = entry['duration']
+
+    def _execute_query(self):
+        with admission.admit(self.connection.alias, self.run_by_user_id, self.timeout):
+            if (
+                self.user_id is not None
+                and kept_cursors.enabled
+                and self.connection.vendor == POSTGRES_VENDOR
+            ):
+                if self.reuse_cursor:
+                    with kept_cursors.checkout(
+                        self.connection, self.user_id, self.sql, params=self.params
+                    ) as kept:
+                        with kept.connection.cursor() as cursor:
+                            self._run(cursor, kept)
+                    return
+                # Running the query again means any cursor kept for it has stale results
+                kept_cursors.discard(self.connection, self.user_id, self.sql, self.params)
+            replicas.read(self.connection, self._run_on)
+
+    def _run_on(self, connection):
+        with connection.cursor() as cursor:
+            self._run(cursor)
+
+    def _run(self, cursor, kept_cursor=None):
+        sql_query = SQLQuery(
+            cursor,
+            self.sql,
+            self.limit,
+            self.page,
+            self.timeout,
+            kept_cursor,
+            count_threshold=self.count_threshold,
+            execution_id=self.execution_id,
+            user_id=self.user_id,
+            params=self.params,
+        )
+        self._data = sql_query.get_results()
+        self._description = sql_query.description
+        self._headers = self._get_headers()
+        self._row_count = sql_query.count
+        self.row_count_is_estimate = sql_query.count_is_estimate
+        self.duration = sql_query.duration
 
     @property
     def data(self):
@@ -189,16 +767,30 @@ class QueryResult(object):
             else [ColumnHeader('--')]
         )
 
+    @property
+    def has_stats(self):
+        """
+        Whether process() would summarise any columns, without summarising them.
+        """
+        return bool(self._get_numerics())
+
     def _get_numerics(self):
         if self.data:
-            d = self.data[0]
-            return [
-                ix
-                for ix, _ in enumerate(self._description)
-                if not isinstance(d[ix], six.string_types) and six.text_type(d[ix]).isnumeric()
-            ]
+            return [ix for ix, d in enumerate(self._description) if self._is_numeric(ix, d)]
         return []
 
+    def _is_numeric(self, ix, description):
+        type_code = description[1] if len(description) > 1 else None
+        if type_code is not None:
+            try:
+                field_type = self.connection.introspection.data_types_reverse[type_code]
+            except (KeyError, TypeError):
+                return False
+            return field_type in NUMERIC_FIELD_TYPES
+        # Without a type code, go by the first value in the column that isn't null
+        value = next((r[ix] for r in self.data if r[ix] is not None), None)
+        return isinstance(value, (int, float, Decimal)) and not isinstance(value, bool)
+
     def column(self, ix):
         return [r[ix] for r in self.data]
 
@@ -208,31 +800,300 @@ class QueryResult(object):
         logger.info("Explorer Query Processing took %sms." % ((time() - start_time) * 1000))
 
     def process_columns(self):
-        for ix in self._get_numerics():
+        numerics = self._get_numerics()
+        if (
+            numerics
+            and app_settings.EXPLORER_FULL_RESULT_STATS
+            and self.connection.vendor == POSTGRES_VENDOR
+            and self.row_count > len(self.data)
+        ):
+            # The page doesn't hold the whole result, so summarise it in the database instead
+            for ix, totals in zip(numerics, self._get_full_result_totals(numerics)):
+                self.headers[ix].summary = ColumnSummary.from_totals(self.headers[ix], *totals)
+            self.stats_cover_full_result = True
+            return
+        for ix in numerics:
             self.headers[ix].add_summary(self.column(ix))
 
+    def _get_full_result_totals(self, numerics):
+        digest = hashlib.sha256(
+            '\0'.join([self.connection.alias, self.sql, repr(self.params), repr(numerics)]).encode(
+                'utf-8'
+            )
+        ).hexdigest()
+        key = '_explorer_full_result_stats_%s' % digest
+        totals = cache.get(key)
+        if totals is None:
+
+            def get_totals(connection):
+                with transaction.atomic(using=connection.alias), connection.cursor() as c:
+                    c.execute(f'SET LOCAL statement_timeout = {self.timeout}')
+                    c.execute(self.full_result_stats_sql(numerics), self.params or None)
+                    return c.fetchone()
+
+            with admission.admit(self.connection.alias, self.run_by_user_id, self.timeout):
+                row = replicas.read(self.connection, get_totals)
+            count = row[0]
+            totals = [(row[i], count, *row[i + 1 : i + 4]) for i in range(1, len(row), 4)]
+            cache.set(key, totals, app_settings.EXPLORER_FULL_RESULT_STATS_TTL)
+        return totals
+
+    def full_result_stats_sql(self, numerics):
+        # The columns of the result are renamed by position, as their names may not be unique
+        sql = self.sql.rstrip().rstrip(';')
+        columns = ', '.join(f'c{ix}' for ix in range(len(self._description)))
+        aggregates = ', '.join(
+            f'sum(coalesce(c{ix}, 0)), min(coalesce(c{ix}, 0)), max(coalesce(c{ix}, 0)), '
+            f'count(*) - count(c{ix})'
+            for ix in numerics
+        )
+        return f'SELECT count(*), {aggregates} FROM ({sql}\n) AS t({columns})'
+
+
+class StreamingQueryResult(object):
+    """
+    The full result of a query, read from a server-side cursor in batches of fetch_size rows so
+    that memory use stays constant however many rows the query returns.
+
+    The query is executed, and the first batch fetched, when the result is created so that
+    database errors are raised before anything has been sent to the client. The remaining batches
+    are fetched as batches() is consumed, inside a transaction that is held open until then. A
+    slot of the limits on concurrent queries is held for as long, and the query is run on a read
+    replica of the connection if it has any.
+    """
+
+    def __init__(self, sql, connection, timeout, fetch_size, params=None, run_by_user_id=None):
+        self.sql = sql
+        self.params = params or None
+        self.alias = connection.alias
+        self.connection = replicas.choose(connection)
+        self.run_by_user_id = run_by_user_id
+        self.timeout = timeout
+        self.fetch_size = fetch_size
+        self._description = None
+        self._fetcher = self._fetch_batches()
+        self._batches = chain([next(self._fetcher)], self._fetcher)
+
+    def _fetch_batches(self):
+        with admission.admit(self.alias, self.run_by_user_id, self.timeout):
+            with transaction.atomic(using=self.connection.alias):
+                if self.connection.vendor == POSTGRES_VENDOR:
+                    with self.connection.cursor() as cursor:
+                        cursor.execute(f'SET LOCAL statement_timeout = {self.timeout}')
+                with self.connection.chunked_cursor() as cursor:
+                    cursor.execute(self.sql, self.params)
+                    batch = cursor.fetchmany(self.fetch_size)
+                    self._description = cursor.description or []
+                    yield batch
+                    while len(batch) == self.fetch_size:
+                        batch = cursor.fetchmany(self.fetch_size)
+                        yield batch
+
+    def batches(self):
+        return self._batches
+
+    def close(self):
+        self._fetcher.close()
+
+    @property
+    def headers(self):
+        return (
+            [ColumnHeader(d[0]) for d in self._description]
+            if self._description
+            else [ColumnHeader('--')]
+        )
+
+    @property
+    def header_strings(self):
+        return [str(h) for h in self.headers]
+
+
+class CopyQueryResult(object):
+    """
+    The full result of a query as CSV, produced by Postgres with COPY (...) TO STDOUT so that
+    no row is ever parsed into Python objects.
+
+    psycopg2 only offers COPY as a blocking call that writes to a file, so it runs in a
+    separate thread that hands chunks of output over through a bounded queue. The thread waits
+    while the queue is full, which keeps memory use constant for slow clients. The first chunk
+    is waited for when the result is created so that database errors are raised before anything
+    has been sent to the client. A slot of the limits on concurrent queries is held until the
+    result is closed, and the query is run on a read replica of the connection if it has any.
+    """
+
+    chunk_size = 64 * 1024
+    queue_size = 16
+
+    def __init__(self, sql, connection, timeout, delimiter, params=None, run_by_user_id=None):
+        self.sql = sql
+        self.params = params or None
+        self.connection = replicas.choose(connection)
+        self.timeout = timeout
+        self.delimiter = delimiter
+        self._queue = Queue(maxsize=self.queue_size)
+        self._closed = threading.Event()
+        self._done = False
+
+        self._admission = ExitStack()
+        self._admission.enter_context(admission.admit(connection.alias, run_by_user_id, timeout))
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.execute(f'SET statement_timeout = {self.timeout}')
+            self._cursor = self.connection.connection.cursor()
+            self._thread = threading.Thread(target=self._copy, daemon=True)
+            self._thread.start()
+            self._first_chunk = self._get()
+        except BaseException:
+            self._admission.close()
+            raise
+
+    @property
+    def copy_sql(self):
+        # trim whitespace and semicolons from the end of the query string
+        sql = self.sql.rstrip().rstrip(';')
+        delimiter = self.delimiter.replace("'", "''")
+        if self.params:
+            delimiter = delimiter.replace('%', '%%')
+        return f"COPY ({sql}\n) TO STDOUT WITH (FORMAT CSV, HEADER, DELIMITER '{delimiter}')"
+
+    def _copy(self):
+        output = _CopyOutput(self)
+        try:
+            try:
+                # COPY can't take parameters, so their values are quoted into the SQL by the
+                # driver
+                sql = (
+                    self._cursor.mogrify(self.copy_sql, self.params)
+                    if self.params
+                    else self.copy_sql
+                )
+                self._cursor.copy_expert(sql, output)
+                output.flush()
+            finally:
+                self._reset_timeout()
+            self._put(None)
+        except Exception as e:
+            self._put(e)
+        finally:
+            self._cursor.close()
+
+    def _reset_timeout(self):
+        # The timeout is set for the session, as COPY runs outside of a transaction, so it is
+        # reset before the connection goes back to the pool. Should the COPY have failed inside
+        # a transaction, rolling that back resets it instead.
+        try:
+            self._cursor.execute('RESET statement_timeout')
+        except self.connection.Database.Error:
+            pass
+
+    def _put(self, item):
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except Full:
+                continue
+
+    def _get(self):
+        item = self._queue.get()
+        if item is None:
+            self._done = True
+        elif isinstance(item, Exception):
+            self._done = True
+            self._thread.join()
+            with self.connection.wrap_database_errors:
+                raise item
+        return item
+
+    def chunks(self):
+        chunk = self._first_chunk
+        while chunk is not None:
+            yield chunk
+            chunk = self._get()
+
+    def close(self):
+        if not self._done:
+            self.connection.connection.cancel()
+        self._closed.set()
+        while True:
+            try:
+                self._queue.get_nowait()
+            except Empty:
+                break
+        self._thread.join()
+        self._admission.close()
+
+
+class _CopyOutput(object):
+    # The file-like object that copy_expert writes to. psycopg2 writes one row at a time, so
+    # rows are gathered into chunks, apart from the first, which is passed on straight away.
+
+    def __init__(self, result):
+        self._result = result
+        self._buffer = []
+        self._size = 0
+        self._first = True
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._size += len(data)
+        if self._first or self._size >= self._result.chunk_size:
+            self._first = False
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._result._put(b''.join(self._buffer))
+            self._buffer = []
+            self._size = 0
+
 
 class SQLQuery(object):
-    def __init__(self, cursor, sql, limit, page, timeout):
+    def __init__(
+        self,
+        cursor,
+        sql,
+        limit,
+        page,
+        timeout,
+        kept_cursor=None,
+        count_threshold=None,
+        execution_id=None,
+        user_id=None,
+        params=None,
+    ):
+        """
+        :param count_threshold: Stop counting the rows of the result once this many have been
+         counted, and use the query planner's estimate of the total instead.
+        :param execution_id: Register the backend running the query under this id, on behalf of
+         user_id, so that it can be cancelled while it runs.
+        :param params: Values to bind to the %s placeholders of the SQL.
+        """
         self.cursor = cursor
         self.sql = sql
+        self.params = params or None
         self.limit = limit
         self.page = page
         self.timeout = timeout
+        self.kept_cursor = kept_cursor
+        self.count_threshold = count_threshold
+        self.execution_id = execution_id
+        self.user_id = user_id
         self.duration = 0
-        self._cursor_name = None
+        self._cursor_name = kept_cursor.name if kept_cursor else None
         self._count = 0
+        self._count_is_estimate = False
+        self._skipped = 0
         self._description = None
 
     @property
     def count(self):
-        if not self._count and self.cursor.db.vendor == POSTGRES_VENDOR:
-            # trim whitespace and semicolons from the end of the query string
-            sql = self.sql.rstrip().rstrip(';')
-            self.cursor.execute(f'select count(*) from ({sql}) t')
-            self._count = self.cursor.fetchone()[0]
         return self._count
 
+    @property
+    def count_is_estimate(self):
+        return self._count_is_estimate
+
     def execute(self):
         start_time = time()
         try:
@@ -242,24 +1103,111 @@ class SQLQuery(object):
         self.duration = (time() - start_time) * 1000
 
     def _execute(self):
-        if self.cursor.db.vendor == POSTGRES_VENDOR:
-            self.cursor.execute(f'SET statement_timeout = {self.timeout}')
-            self.cursor.execute(f'DECLARE {self.cursor_name} CURSOR WITH HOLD FOR {self.sql}')
+        if self.kept_cursor:
+            self._execute_kept()
+        elif self.cursor.db.vendor == POSTGRES_VENDOR:
+            statements = [
+                f'SET LOCAL statement_timeout = {self.timeout}',
+                f'DECLARE {self.cursor_name} CURSOR FOR {self.sql}',
+            ]
             if self.page and self.page > 1:
+                # The number of rows skipped is needed to count the rows of a short page, and
+                # only the last of a batch of statements reports how many rows it affected
                 offset = (self.page - 1) * self.limit
-                self.cursor.execute(f'MOVE {offset} FROM {self.cursor_name}')
-            self.cursor.execute(f'FETCH {self.limit} FROM {self.cursor_name}')
+                statements.append(f'MOVE {offset} FROM {self.cursor_name}')
+                self._execute_batch(statements, self.params)
+                self._skipped = self.cursor.rowcount
+                self._execute_batch([f'FETCH {self.limit} FROM {self.cursor_name}'])
+            else:
+                statements.append(f'FETCH {self.limit} FROM {self.cursor_name}')
+                self._execute_batch(statements, self.params)
         else:
-            self.cursor.execute(self.sql)
+            self.cursor.execute(self.sql, self.params)
+
+    def _execute_kept(self):
+        # The kept cursor is scrollable, so any page can be reached from wherever the previous
+        # fetch left it without running the query again
+        statements = []
+        params = None
+        if not self.kept_cursor.declared:
+            params = self.params
+            statements += [
+                f'SET statement_timeout = {self.timeout}',
+                f'DECLARE {self.cursor_name} SCROLL CURSOR WITH HOLD FOR {self.sql}',
+            ]
+            self.kept_cursor.declared = True
+        offset = (self.page - 1) * self.limit if self.page and self.page > 1 else 0
+        statements += [
+            f'MOVE ABSOLUTE {offset} FROM {self.cursor_name}',
+            f'FETCH {self.limit} FROM {self.cursor_name}',
+        ]
+        self._execute_batch(statements, params)
+
+    def _execute_batch(self, statements, params=None):
+        # Statements are sent together, in one round trip to the database, and the cursor holds
+        # the result of the last. Each starts on a new line so that a comment at the end of the
+        # SQL can't swallow the next.
+        self.cursor.execute('\n;'.join(statements), params)
 
     def get_results(self):
-        self.execute()
-        self._description = self.cursor.description or []
-        results = [list(r) for r in self.cursor]
-        if self.cursor.db.vendor == POSTGRES_VENDOR:
-            self.cursor.execute(f'CLOSE {self.cursor_name}')
+        # Committing the transaction closes the cursor, unless the transaction is nested in one
+        # that is already open
+        close = self.cursor.db.in_atomic_block
+        with self._transaction(), self._registration():
+            self.execute()
+            self._description = self.cursor.description or []
+            results = [list(r) for r in self.cursor]
+            if self.cursor.db.vendor == POSTGRES_VENDOR:
+                self._count = self._count_rows(len(results))
+                if not self.kept_cursor and close:
+                    self.cursor.execute(f'CLOSE {self.cursor_name}')
         return results
 
+    def _transaction(self):
+        # A cursor WITH HOLD outlives the transaction that declared it by copying the whole
+        # result when the transaction commits, so the page is read from a cursor that lives only
+        # as long as an explicit transaction instead. Should anything fail before the cursor is
+        # closed, rolling the transaction back closes it.
+        if self.kept_cursor or self.cursor.db.vendor != POSTGRES_VENDOR:
+            return nullcontext()
+        return transaction.atomic(using=self.cursor.db.alias)
+
+    def _registration(self):
+        if self.execution_id is None or self.cursor.db.vendor != POSTGRES_VENDOR:
+            return nullcontext()
+        return running_queries.register(self.execution_id, self.cursor, self.user_id, self.timeout)
+
+    def _count_rows(self, fetched):
+        # The cursor has already run the query, so rather than running it again to count the
+        # rows, count those left after the page by moving the cursor to the end
+        if self.kept_cursor:
+            if self.kept_cursor.row_count is None:
+                self.cursor.execute(f'MOVE ABSOLUTE 0 FROM {self.cursor_name}')
+                self.kept_cursor.row_count = self._count_remaining(0)
+                self.kept_cursor.row_count_is_estimate = self._count_is_estimate
+            self._count_is_estimate = self.kept_cursor.row_count_is_estimate
+            return self.kept_cursor.row_count
+        if fetched < self.limit:
+            return self._skipped + fetched
+        return self._count_remaining(self._skipped + fetched)
+
+    def _count_remaining(self, counted):
+        if self.count_threshold is None:
+            self.cursor.execute(f'MOVE FORWARD ALL FROM {self.cursor_name}')
+            return counted + self.cursor.rowcount
+        to_count = max(self.count_threshold - counted, 1)
+        self.cursor.execute(f'MOVE FORWARD {to_count} FROM {self.cursor_name}')
+        counted += self.cursor.rowcount
+        if self.cursor.rowcount < to_count:
+            return counted
+        self._count_is_estimate = True
+        return max(self._estimate_count(), counted)
+
+    def _estimate_count(self):
+        self.cursor.execute(f'EXPLAIN (FORMAT JSON) {self.sql}', self.params)
+        plan = self.cursor.fetchone()[0]
+        return int(plan[0]['Plan']['Plan Rows'])
+
     @property
     def cursor_name(self):
         if not self._cursor_name:
@@ -286,14 +1234,9 @@ class ColumnHeader(object):
 
 @six.python_2_unicode_compatible
 class ColumnStat(object):
-    def __init__(self, label, statfn, precision=2, handles_null=False):
+    def __init__(self, label, value, precision=2):
         self.label = label
-        self.statfn = statfn
-        self.precision = precision
-        self.handles_null = handles_null
-
-    def __call__(self, coldata):
-        self.value = round(float(self.statfn(coldata)), self.precision) if coldata else 0
+        self.value = round(float(value), precision)
 
     def __str__(self):
         return self.label
@@ -303,17 +1246,36 @@ class ColumnStat(object):
 class ColumnSummary(object):
     def __init__(self, header, col):
         self._header = header
+
+        # All the stats are gathered in one pass over the column. Nulls count as 0 towards the
+        # sum, average, min and max.
+        total = nulls = 0
+        low = high = None
+        for value in col:
+            if value is None:
+                nulls += 1
+                value = 0
+            total += value
+            if low is None or value < low:
+                low = value
+            if high is None or value > high:
+                high = value
+        self._set_stats(total, len(col), low, high, nulls)
+
+    @classmethod
+    def from_totals(cls, header, total, count, low, high, nulls):
+        summary = cls(header, [])
+        summary._set_stats(total, count, low, high, nulls)
+        return summary
+
+    def _set_stats(self, total, count, low, high, nulls):
         self._stats = [
-            ColumnStat("Sum", sum),
-            ColumnStat("Avg", lambda x: float(sum(x)) / float(len(x))),
-            ColumnStat("Min", min),
-            ColumnStat("Max", max),
-            ColumnStat("NUL", lambda x: int(sum(map(lambda y: 1 if y is None else 0, x))), 0, True),
+            ColumnStat("Sum", total or 0),
+            ColumnStat("Avg", float(total) / count if count else 0),
+            ColumnStat("Min", low or 0),
+            ColumnStat("Max", high or 0),
+            ColumnStat("NUL", nulls, 0),
         ]
-        without_nulls = list(map(lambda x: 0 if x is None else x, col))
-
-        for stat in self._stats:
-            stat(col) if stat.handles_null else stat(without_nulls)
 
     @property
     def stats(self):
@@ -0,0 +1,104 @@
+import logging
+import threading
+
+import psycopg2
+import psycopg2.extras
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import DisconnectionError
+from sqlalchemy.pool import QueuePool
+
+from explorer import app_settings
+
+logger = logging.getLogger(__name__)
+
+# One bounded pool of psycopg2 connections per Explorer connection alias, shared by every thread
+# of the process. Query execution draws on it through the explorer.pooled_postgresql database
+# backend, and schema introspection through a SQLAlchemy engine built on the same pool.
+
+
+def _ping(dbapi_connection, connection_record, connection_proxy):
+    # Check that a connection still works before handing it out, so that connections dropped
+    # by the server while idle are replaced rather than failing the query that gets them
+    try:
+        with dbapi_connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if not dbapi_connection.autocommit:
+            dbapi_connection.rollback()
+    except psycopg2.Error:
+        raise DisconnectionError()
+
+
+class ConnectionPools(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pools = {}
+        self._engines = {}
+
+    def get(self, connection):
+        """
+        :param connection: A Django connection, whose settings are used to make the connections
+         of a new pool.
+        """
+        with self._lock:
+            pool = self._pools.get(connection.alias)
+            if pool is None:
+                params = connection.get_connection_params()
+                pool = self._pools[connection.alias] = QueuePool(
+                    lambda: self._connect(params),
+                    pool_size=app_settings.EXPLORER_POOL_SIZE,
+                    max_overflow=app_settings.EXPLORER_POOL_MAX_OVERFLOW,
+                    timeout=app_settings.EXPLORER_POOL_TIMEOUT,
+                    recycle=app_settings.EXPLORER_POOL_RECYCLE,
+                )
+                event.listen(pool, 'checkout', _ping)
+                # SQLAlchemy only initialises the dialect, with the server version that
+                # introspection depends on, on the first connection made after the engine, so
+                # the engine is made before anything checks a connection out of the pool
+                self._engines[connection.alias] = create_engine(
+                    'postgresql+psycopg2://',
+                    pool=pool,
+                    use_native_uuid=False,
+                    use_native_hstore=False,
+                )
+            return pool
+
+    def _connect(self, params):
+        connection = psycopg2.connect(**params)
+        # As Django's backend does, so that jsonb values read through the pool are left as text
+        psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    def engine(self, connection):
+        """
+        A SQLAlchemy engine that takes its connections from the pool of this Django connection.
+        Native uuid and hstore handling is turned off so that the engine doesn't change how
+        values are read on connections that are later used for queries.
+        """
+        self.get(connection)
+        with self._lock:
+            return self._engines[connection.alias]
+
+    def metrics(self):
+        """
+        :return: The size, idle and in-use connections, and overflow of each pool, by alias.
+        """
+        with self._lock:
+            return {
+                alias: {
+                    'size': pool.size(),
+                    'checked_in': pool.checkedin(),
+                    'checked_out': pool.checkedout(),
+                    'overflow': pool.overflow(),
+                }
+                for alias, pool in self._pools.items()
+            }
+
+    def dispose_all(self):
+        with self._lock:
+            for pool in self._pools.values():
+                pool.dispose()
+            self._pools.clear()
+            self._engines.clear()
+
+
+pools = ConnectionPools()
@@ -0,0 +1,54 @@
+import logging
+
+import psycopg2
+from django.db.backends.postgresql import base
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from explorer.pool import pools
+
+logger = logging.getLogger(__name__)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    The PostgreSQL backend, taking its connections from explorer.pool rather than opening one for
+    each thread. Closing the connection hands it back to the pool after DISCARD ALL, so that no
+    session state, such as settings or open cursors, is left for its next user.
+    """
+
+    # Connections that are held for a long time, such as those behind kept paging cursors, turn
+    # this off so that they don't take up the pool
+    use_pool = True
+    _pooled = None
+
+    def get_new_connection(self, conn_params):
+        if not self.use_pool:
+            return super().get_new_connection(conn_params)
+        try:
+            self._pooled = pools.get(self).connect()
+        except PoolTimeoutError as e:
+            logger.warning('Explorer connection pools exhausted: %s', pools.metrics())
+            raise psycopg2.OperationalError(str(e))
+        connection = self._pooled.connection
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        if isolation_level is None:
+            self.isolation_level = connection.isolation_level
+        else:
+            self.isolation_level = isolation_level
+            if isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=isolation_level)
+        return connection
+
+    def _close(self):
+        if self._pooled is None:
+            return super()._close()
+        pooled, self._pooled = self._pooled, None
+        try:
+            self.connection.rollback()
+            self.connection.autocommit = True
+            with self.connection.cursor() as cursor:
+                cursor.execute('DISCARD ALL')
+        except psycopg2.Error:
+            pooled.invalidate()
+        finally:
+            pooled.close()
@@ -0,0 +1,149 @@
+import logging
+import random
+import threading
+from contextlib import contextmanager
+from time import time
+
+from django.db import connections as djcs, OperationalError
+
+from explorer import app_settings
+
+logger = logging.getLogger(__name__)
+
+# Explorer connections may list read-only replicas in EXPLORER_READ_REPLICAS, and the queries
+# run on them are spread over the replicas instead. Each replica's replication lag and number
+# of active backends are measured at most every EXPLORER_REPLICA_CHECK_INTERVAL seconds by each
+# process. Replicas lagging by more than EXPLORER_REPLICA_MAX_LAG seconds are left out, and of
+# the others the one with the fewest active backends, counting the queries this process has
+# started on it since, is used. A replica that can't be connected to is left out until the next
+# check, and the query is tried on the next one, or in the end on the connection itself.
+
+# A replica can also go away while a query runs on it. Pages of results and their totals are
+# read with read(), which runs them again on the next choice should the replica's connection be
+# lost, as none of their rows have been returned by then. Downloads and kept cursors, which
+# hand rows on as they are read, are only moved to another replica when they connect.
+
+REPLICA_STATUS_SQL = """
+SELECT
+    CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+        THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END,
+    (SELECT count(*) FROM pg_stat_activity WHERE state = 'active' AND pid <> pg_backend_pid())
+"""
+
+
+class ReplicaStatus(object):
+    def __init__(self, lag=None, active=0, available=True):
+        self.lag = lag
+        self.active = active
+        self.available = available
+        self.checked_at = time()
+
+
+class Replicas(object):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._statuses = {}
+        self._in_flight = {}
+
+    def aliases(self, alias):
+        return app_settings.EXPLORER_READ_REPLICAS.get(alias, [])
+
+    def choose(self, connection):
+        """
+        :param connection: The Django connection of an Explorer connection.
+        :return: The connection of the least loaded of its replicas that is up to date and can
+         be connected to, or the connection itself if none can be used.
+        """
+        for alias in self._candidates(connection.alias):
+            replica = djcs[alias]
+            try:
+                replica.ensure_connection()
+            except OperationalError:
+                logger.warning('Read replica %s is unavailable', alias, exc_info=True)
+                self._set_status(alias, ReplicaStatus(available=False))
+                continue
+            return replica
+        return connection
+
+    @contextmanager
+    def route(self, connection):
+        """
+        Yield the connection to run a query on, as chosen by choose(), counting the query
+        towards its load for as long as the block runs.
+        """
+        chosen = self.choose(connection)
+        with self._lock:
+            self._in_flight[chosen.alias] = self._in_flight.get(chosen.alias, 0) + 1
+        try:
+            yield chosen
+        finally:
+            with self._lock:
+                self._in_flight[chosen.alias] -= 1
+
+    def read(self, connection, run):
+        """
+        :param run: Called with the connection chosen by route() to run a query on, and called
+         again with the next choice should it fail by losing the connection to a replica. It
+         must not hand on any rows before it returns.
+        :return: What run returns.
+        """
+        while True:
+            with self.route(connection) as chosen:
+                try:
+                    return run(chosen)
+                except OperationalError:
+                    # Timeouts and cancellations are OperationalErrors too, but leave the
+                    # connection open
+                    if chosen is connection or not self._lost(chosen):
+                        raise
+                    logger.warning('Read replica %s was lost', chosen.alias, exc_info=True)
+                    self._set_status(chosen.alias, ReplicaStatus(available=False))
+
+    def _lost(self, connection):
+        return connection.connection is None or bool(connection.connection.closed)
+
+    def _candidates(self, alias):
+        candidates = []
+        for replica in self.aliases(alias):
+            status = self.status(replica)
+            if not status.available or status.lag > app_settings.EXPLORER_REPLICA_MAX_LAG:
+                continue
+            with self._lock:
+                load = status.active + self._in_flight.get(replica, 0)
+            candidates.append((load, random.random(), replica))
+        return [replica for _, _, replica in sorted(candidates)]
+
+    def status(self, alias):
+        with self._lock:
+            status = self._statuses.get(alias)
+        if (
+            status is None
+            or time() - status.checked_at > app_settings.EXPLORER_REPLICA_CHECK_INTERVAL
+        ):
+            status = self._set_status(alias, self._check(alias))
+        return status
+
+    def _check(self, alias):
+        try:
+            with djcs[alias].cursor() as cursor:
+                cursor.execute(REPLICA_STATUS_SQL)
+                lag, active = cursor.fetchone()
+        except OperationalError:
+            logger.warning('Read replica %s is unavailable', alias, exc_info=True)
+            return ReplicaStatus(available=False)
+        return ReplicaStatus(float(lag), active)
+
+    def _set_status(self, alias, status):
+        with self._lock:
+            self._statuses[alias] = status
+        return status
+
+    def reset(self):
+        with self._lock:
+            self._statuses.clear()
+
+
+replicas = Replicas()
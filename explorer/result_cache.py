@@ -0,0 +1,81 @@
+import hashlib
+import uuid
+
+from django.core.cache import cache
+
+from explorer import app_settings
+
+# Pages of results are kept in the Django cache, so that opening the same query with the same
+# params again within EXPLORER_RESULT_CACHE_TTL seconds, or the TTL set on the query, doesn't
+# run it against the database.
+
+# The cache backend evicts entries by its own rules, so the keys of cached results are also
+# listed under INDEX_KEY, oldest first, and the oldest are deleted once there are more than
+# EXPLORER_RESULT_CACHE_MAX_ENTRIES. Concurrent writers may lose each other's updates to the
+# list, in which case a result is merely left to expire with its TTL.
+
+INDEX_KEY = '_explorer_result_cache_keys'
+
+# References to pages kept for their column statistics are cached under a random id, whoever ran
+# them, and are only given back to the same user.
+
+STATS_PAGE_KEY = '_explorer_stats_page_%s'
+
+
+class ResultCache(object):
+    @property
+    def enabled(self):
+        return app_settings.EXPLORER_RESULT_CACHE_TTL > 0
+
+    def ttl(self, ttl=None):
+        """
+        :param ttl: The TTL set for a query, if any, which takes the place of
+         EXPLORER_RESULT_CACHE_TTL.
+        """
+        return app_settings.EXPLORER_RESULT_CACHE_TTL if ttl is None else ttl
+
+    def key(self, connection, sql, page, limit, params=None):
+        digest = hashlib.sha256(
+            '\0'.join([connection.alias, sql, repr(params or []), str(page), str(limit)]).encode(
+                'utf-8'
+            )
+        ).hexdigest()
+        return '_explorer_result_%s' % digest
+
+    def get(self, key):
+        return cache.get(key)
+
+    def set(self, key, entry, ttl=None):
+        if len(entry['data']) > app_settings.EXPLORER_RESULT_CACHE_MAX_ROWS:
+            return
+        cache.set(key, entry, self.ttl(ttl))
+        keys = [k for k in cache.get(INDEX_KEY, []) if k != key] + [key]
+        excess = len(keys) - app_settings.EXPLORER_RESULT_CACHE_MAX_ENTRIES
+        if excess > 0:
+            cache.delete_many(keys[:excess])
+            keys = keys[excess:]
+        cache.set(INDEX_KEY, keys, None)
+
+    def keep_for_stats(self, ref, user_id):
+        """
+        :return: The id to fetch the reference by with kept_for_stats.
+        """
+        stats_id = uuid.uuid4().hex
+        cache.set(
+            STATS_PAGE_KEY % stats_id,
+            {**ref, 'user_id': user_id},
+            app_settings.EXPLORER_STATS_PAGE_TTL,
+        )
+        return stats_id
+
+    def kept_for_stats(self, stats_id, user_id):
+        ref = cache.get(STATS_PAGE_KEY % stats_id) if stats_id else None
+        if ref is None or ref['user_id'] != user_id:
+            return None
+        return ref
+
+    def clear(self):
+        cache.delete_many(cache.get(INDEX_KEY, []) + [INDEX_KEY])
+
+
+result_cache = ResultCache()
@@ -3,7 +3,6 @@ from collections import namedtuple
 
 from django.core.cache import cache
 from geoalchemy2 import Geometry  # Needed for sqlalchemy to understand geometry columns
-from sqlalchemy import create_engine
 from sqlalchemy.dialects.postgresql.array import ARRAY
 from sqlalchemy.dialects.postgresql.base import DOUBLE_PRECISION, ENUM, TIMESTAMP, UUID
 from sqlalchemy.engine.reflection import Inspector
@@ -29,6 +28,7 @@ from explorer.app_settings import (
     EXPLORER_SCHEMA_INCLUDE_TABLE_PREFIXES,
     EXPLORER_SCHEMA_INCLUDE_VIEWS,
 )
+from explorer.pool import pools
 from explorer.tasks import build_schema_cache_async
 from explorer.utils import get_valid_connection
 
@@ -122,13 +122,7 @@ def build_schema_info(connection_alias, schema=None, table=None):
         """
     connection = get_valid_connection(connection_alias)
 
-    engine = create_engine(
-        f'postgresql://{connection.settings_dict["USER"]}:{connection.settings_dict["PASSWORD"]}'
-        f'@{connection.settings_dict["HOST"]}:{connection.settings_dict["PORT"]}/'
-        f'{connection.settings_dict["NAME"]}'
-    )
-
-    insp = Inspector.from_engine(engine)
+    insp = Inspector.from_engine(pools.engine(connection))
     if schema and table:
         return _get_columns_for_table(insp, schema, table)
 
@@ -141,7 +135,6 @@ def build_schema_info(connection_alias, schema=None, table=None):
         columns = _get_columns_for_table(insp, schema, table_name)
         tables.append(Table(TableName(schema, table_name), columns))
 
-    engine.dispose()
     return tables
 
 
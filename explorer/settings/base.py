@@ -173,6 +173,26 @@ else:
 
     DATABASES = {'default': DB_CONFIG, 'datasets': DATASETS_DB_CONFIG}
 
+if env.bool('EXPLORER_POOL_CONNECTIONS', default=False):
+    DATABASES['datasets']['ENGINE'] = 'explorer.pooled_postgresql'
+    EXPLORER_POOL_SIZE = env.int('EXPLORER_POOL_SIZE', default=5)
+
+EXPLORER_READ_REPLICAS = {}
+for i, url in enumerate(env.list('DATASETS_REPLICA_URLS', default=[])):
+    DATABASES[f'datasets_replica_{i}'] = {
+        **dj_database_url.parse(url),
+        'ENGINE': DATABASES['datasets']['ENGINE'],
+    }
+    EXPLORER_READ_REPLICAS.setdefault('datasets', []).append(f'datasets_replica_{i}')
+EXPLORER_REPLICA_MAX_LAG = env.int('EXPLORER_REPLICA_MAX_LAG', default=30)
+
+EXPLORER_MAX_CONCURRENT_QUERIES = {
+    'datasets': env.int('EXPLORER_MAX_CONCURRENT_QUERIES', default=None)
+}
+EXPLORER_MAX_CONCURRENT_QUERIES_PER_USER = env.int(
+    'EXPLORER_MAX_CONCURRENT_QUERIES_PER_USER', default=None
+)
+
 EXPLORER_CONNECTIONS = {'datasets': 'datasets'}
 EXPLORER_DEFAULT_CONNECTION = 'datasets'
 
@@ -186,6 +206,14 @@ EXPLORER_SCHEMA_EXCLUDE_TABLE_PREFIXES = (
     'dynamic_models',
 )
 
+EXPLORER_STREAMING_EXPORTS = env.bool('EXPLORER_STREAMING_EXPORTS', default=False)
+EXPLORER_CSV_COPY_EXPORTS = env.bool('EXPLORER_CSV_COPY_EXPORTS', default=False)
+EXPLORER_PAGING_CURSOR_TTL = env.int('EXPLORER_PAGING_CURSOR_TTL', default=0)
+EXPLORER_EXACT_COUNT_THRESHOLD = env.int('EXPLORER_EXACT_COUNT_THRESHOLD', default=None)
+EXPLORER_RESULT_CACHE_TTL = env.int('EXPLORER_RESULT_CACHE_TTL', default=0)
+EXPLORER_FULL_RESULT_STATS = env.bool('EXPLORER_FULL_RESULT_STATS', default=False)
+EXPLORER_QUERY_LOG_FLUSH_INTERVAL = env.int('EXPLORER_QUERY_LOG_FLUSH_INTERVAL', default=0)
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -316,6 +344,7 @@ else:
     # asynchronous schema loading
     EXPLORER_TASKS_ENABLED = True
     EXPLORER_ASYNC_SCHEMA = True
+    EXPLORER_ASYNC_QUERIES = env.bool('EXPLORER_ASYNC_QUERIES', default=False)
 
     # Celery
     CELERY_BROKER_URL = env.str('REDIS_URL', '')
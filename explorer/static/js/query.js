@@ -76,3 +76,104 @@ if (sqlTextarea !== null) {
       );
   }
 }
+
+// Query cancellation
+// While a query runs in the request that the form was submitted with, offer to cancel it, and
+// cancel it if the page is closed before the results arrive. The page is replaced by the
+// results when they arrive, so the pagehide listener is only added on submitting a run.
+let cancelButton = document.getElementById('cancel_button');
+if (cancelButton !== null) {
+  let form = document.getElementById('editor');
+
+  function cancel(beacon) {
+    var data = new FormData();
+    data.append('csrfmiddlewaretoken', form.elements['csrfmiddlewaretoken'].value);
+    if (beacon) {
+      navigator.sendBeacon(cancelButton.dataset.cancelUrl, data);
+    } else {
+      fetch(cancelButton.dataset.cancelUrl, {method: 'POST', body: data, credentials: 'same-origin'});
+    }
+  }
+
+  function cancelOnPageHide() {
+    cancel(true);
+  }
+
+  function stopRunning() {
+    cancelButton.hidden = true;
+    window.removeEventListener('pagehide', cancelOnPageHide);
+  }
+
+  form.addEventListener('submit', function (event) {
+    var action = event.submitter ? event.submitter.value : 'run';
+    if (['run', 'fetch-page', 'refresh'].indexOf(action) !== -1) {
+      cancelButton.hidden = false;
+      window.addEventListener('pagehide', cancelOnPageHide);
+    }
+  });
+  cancelButton.addEventListener('click', function () {
+    cancel(false);
+    stopRunning();
+  });
+  // A page restored from the back/forward cache has no submission outstanding
+  window.addEventListener('pageshow', function (event) {
+    if (event.persisted) {
+      stopRunning();
+    }
+  });
+}
+
+// Column statistics
+// They are only computed when they are asked for
+let statsButton = document.getElementById('stats_button');
+if (statsButton !== null) {
+  let form = document.getElementById('editor');
+
+  function cell(tag, text) {
+    var node = document.createElement(tag);
+    node.className = tag === 'th' ? 'govuk-table__header' : 'govuk-table__cell';
+    node.textContent = text;
+    return node;
+  }
+
+  statsButton.addEventListener('click', function () {
+    statsButton.disabled = true;
+    fetch(statsButton.dataset.statsUrl, {method: 'POST', body: new FormData(form), credentials: 'same-origin'})
+      .then(function (response) { return response.json(); })
+      .then(function (result) {
+        var head = document.getElementById('stats_head');
+        var body = document.getElementById('stats_body');
+        var columns = result.columns || [];
+        head.appendChild(cell('th', ''));
+        columns.forEach(function (column) { head.appendChild(cell('th', column.name)); });
+        ['Sum', 'Avg', 'Min', 'Max', 'NUL'].forEach(function (label) {
+          var row = document.createElement('tr');
+          row.className = 'govuk-table__row';
+          row.appendChild(cell('th', label));
+          columns.forEach(function (column) { row.appendChild(cell('td', column.stats[label])); });
+          body.appendChild(row);
+        });
+        document.getElementById('stats_caption').textContent = result.full_result
+          ? 'Statistics over every row of the result' : 'Statistics over the rows of this page';
+        document.getElementById('stats').hidden = false;
+        statsButton.hidden = true;
+      });
+  });
+}
+
+// Query jobs
+// The page is reloaded to show the results once the job running the query finishes
+let queryJob = document.getElementById('query-job');
+if (queryJob !== null) {
+  (function poll() {
+    fetch(queryJob.dataset.statusUrl, {credentials: 'same-origin'})
+      .then(function (response) { return response.json(); })
+      .then(function (job) {
+        if (job.status === 'pending' || job.status === 'running') {
+          setTimeout(poll, 2000);
+        } else {
+          window.location.reload();
+        }
+      });
+  })();
+}
@@ -1,10 +1,12 @@
-from datetime import datetime, timedelta
+from datetime import timedelta
 
 
 from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
 
 from explorer import app_settings
-from explorer.models import QueryLog
+from explorer.models import QueryJob, QueryLog
 
 if app_settings.ENABLE_TASKS:
     from celery import task
@@ -20,10 +22,40 @@ else:
 
 @task
 def truncate_querylogs(days):
-    qs = QueryLog.objects.filter(run_at__lt=datetime.now() - timedelta(days=days))
-    logger.info('Deleting %s QueryLog objects older than %s days.' % (qs.count, days))
-    qs.delete()
-    logger.info('Done deleting QueryLog objects.')
+    cutoff = timezone.now() - timedelta(days=days)
+    logger.info('Deleting QueryLog and QueryJob objects older than %s days.' % days)
+    _delete_in_batches(
+        QueryJob, QueryJob.objects.filter(created_at__lt=cutoff).order_by('created_at')
+    )
+    _delete_in_batches(
+        QueryLog,
+        QueryLog.objects.filter(run_at__lt=cutoff).order_by('run_at'),
+        # What deleting through the ORM would do for jobs that refer to the logs
+        before_delete=lambda ids: QueryJob.objects.filter(query_log_id__in=ids).update(
+            query_log=None
+        ),
+    )
+
+
+def _delete_in_batches(model, queryset, before_delete=None):
+    # Rows are deleted in batches, each in a transaction of its own, with plain DELETEs rather
+    # than through the ORM, so that neither memory use nor how long rows are locked for grows
+    # with the number of rows
+    batch_size = app_settings.EXPLORER_QUERY_LOG_DELETE_BATCH_SIZE
+    name = model.__name__
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(queryset.values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            if before_delete:
+                before_delete(ids)
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {model._meta.db_table} WHERE id = ANY(%s)', [ids])
+                deleted += cursor.rowcount
+        logger.info('Deleted %s %s objects so far.' % (deleted, name))
+    logger.info('Done deleting %s %s objects.' % (deleted, name))
 
 
 @task
@@ -33,3 +65,8 @@ def build_schema_cache_async(connection_alias, schema=None, table=None):
     ret = build_schema_info(connection_alias, schema, table)
     cache.set(connection_schema_cache_key(connection_alias), ret)
     return ret
+
+
+@task
+def execute_query_job(job_id, refresh_cache=False):
+    QueryJob.objects.get(pk=job_id).run(refresh_cache)
@@ -0,0 +1,99 @@
+import threading
+from time import sleep
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from explorer.admission import admission, QueryRejected
+from explorer.tests.factories import SimpleQueryFactory
+
+
+@patch('explorer.app_settings.EXPLORER_ADMISSION_TIMEOUT', 0)
+@patch('explorer.app_settings.EXPLORER_MAX_CONCURRENT_QUERIES_PER_USER', 1)
+@patch('explorer.app_settings.EXPLORER_MAX_CONCURRENT_QUERIES', {'default': 2})
+class TestAdmission(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_connection_limit(self):
+        with admission.admit('default'), admission.admit('default'):
+            self.assertEqual(admission.running('default'), 2)
+            with self.assertRaises(QueryRejected):
+                with admission.admit('default'):
+                    pass
+            with admission.admit('alt'):
+                pass
+        self.assertEqual(admission.running('default'), 0)
+
+    def test_user_limit(self):
+        with admission.admit('default', 1):
+            with self.assertRaises(QueryRejected) as cm:
+                with admission.admit('default', 1):
+                    pass
+            self.assertIn('You already have 1 queries running', str(cm.exception))
+            with admission.admit('default', 2):
+                pass
+            with admission.admit('alt', 1):
+                pass
+        self.assertEqual(admission.running('default', 1), 0)
+
+    def test_users_over_their_limit_dont_take_connection_slots(self):
+        with admission.admit('default', 1):
+            with self.assertRaises(QueryRejected):
+                with admission.admit('default', 1):
+                    pass
+            self.assertEqual(admission.running('default'), 1)
+
+    def test_slots_are_released_on_errors(self):
+        with self.assertRaises(ValueError):
+            with admission.admit('default', 1):
+                raise ValueError()
+        self.assertEqual(admission.running('default'), 0)
+        self.assertEqual(admission.running('default', 1), 0)
+
+    def test_queries_wait_for_a_slot(self):
+        def hold():
+            with admission.admit('default', 1):
+                started.set()
+                sleep(0.3)
+            finished.set()
+
+        started, finished = threading.Event(), threading.Event()
+        thread = threading.Thread(target=hold)
+        thread.start()
+        started.wait()
+        with patch('explorer.app_settings.EXPLORER_ADMISSION_TIMEOUT', 5):
+            with admission.admit('default', 1):
+                finished.wait(1)
+                self.assertTrue(finished.is_set())
+        thread.join()
+
+    def test_queries_over_the_limit_are_rejected(self):
+        query = SimpleQueryFactory(sql='select 1', connection='default')
+        with admission.admit('default'), admission.admit('default'):
+            self.assertRaises(QueryRejected, query.execute, 1, 10, 10000)
+        self.assertEqual(query.execute(1, 10, 10000).data, [[1]])
+
+    def test_cached_results_dont_wait_for_a_slot(self):
+        query = SimpleQueryFactory(sql='select 1', connection='default')
+        with patch('explorer.app_settings.EXPLORER_RESULT_CACHE_TTL', 300):
+            query.execute(1, 10, 10000)
+            with admission.admit('default'), admission.admit('default'):
+                self.assertTrue(query.execute(1, 10, 10000).from_cache)
+
+    def test_downloads_hold_a_slot_until_they_are_closed(self):
+        query = SimpleQueryFactory(
+            sql='select g from generate_series(1, 3) g', connection='default'
+        )
+        for execute in (
+            lambda: query.execute_streaming(10000, 1, run_by_user_id=1),
+            lambda: query.execute_csv_copy(10000, ',', run_by_user_id=1),
+        ):
+            res = execute()
+            self.assertEqual(admission.running('default'), 1)
+            self.assertEqual(admission.running('default', 1), 1)
+            self.assertRaises(QueryRejected, query.execute_streaming, 10000, 1, 1)
+            res.close()
+            self.assertEqual(admission.running('default'), 0)
+            self.assertEqual(admission.running('default', 1), 0)
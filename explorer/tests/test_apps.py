@@ -16,3 +16,10 @@ class TestApps(TestCase):
     def test_validates_all_connections(self, mocked_connections):
         mocked_connections.return_value = {'garbage1': 'in', 'garbage2': 'out'}
         self.assertRaises(ImproperlyConfigured, _validate_connections)
+
+    @patch('explorer.apps._get_read_replicas')
+    def test_validates_read_replicas(self, mocked_replicas):
+        mocked_replicas.return_value = {'default': ['garbage']}
+        self.assertRaises(ImproperlyConfigured, _validate_connections)
+        mocked_replicas.return_value = {'garbage': ['alt']}
+        self.assertRaises(ImproperlyConfigured, _validate_connections)
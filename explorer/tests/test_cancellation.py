@@ -0,0 +1,60 @@
+import threading
+from time import sleep
+
+from django.core.cache import cache
+from django.db import connections, DatabaseError
+from django.test import TestCase
+
+from explorer.app_settings import EXPLORER_DEFAULT_CONNECTION as CONN
+from explorer.cancellation import running_queries
+from explorer.models import QueryResult
+
+
+class TestRunningQueries(TestCase):
+    def _run_in_thread(self, sql, execution_id):
+        errors = []
+
+        def run():
+            try:
+                QueryResult(
+                    sql, connections[CONN], 1, 10, 20000, user_id=1, execution_id=execution_id
+                )
+            except DatabaseError as e:
+                errors.append(e)
+            finally:
+                connections[CONN].close()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        for _ in range(50):
+            if cache.get(running_queries.key(execution_id)):
+                break
+            sleep(0.1)
+        return thread, errors
+
+    def test_running_queries_can_be_cancelled(self):
+        thread, errors = self._run_in_thread('select pg_sleep(10)', 'test-cancel')
+        self.assertTrue(running_queries.cancel('test-cancel', user_id=1))
+        thread.join(10)
+        self.assertFalse(thread.is_alive())
+        self.assertIn('canceling statement', str(errors[0]))
+        self.assertIsNone(cache.get(running_queries.key('test-cancel')))
+
+    def test_queries_can_only_be_cancelled_by_the_user_who_ran_them(self):
+        thread, errors = self._run_in_thread('select pg_sleep(1)', 'test-other-user')
+        self.assertFalse(running_queries.cancel('test-other-user', user_id=2))
+        thread.join(10)
+        self.assertEqual(errors, [])
+
+    def test_backends_running_other_queries_are_not_cancelled(self):
+        # As if the backend had gone back to the pool and been given to another query
+        thread, errors = self._run_in_thread('select pg_sleep(1)', 'test-reused')
+        key = running_queries.key('test-reused')
+        cache.set(key, {**cache.get(key), 'token': 'another'})
+        self.assertFalse(running_queries.cancel('test-reused', user_id=1))
+        thread.join(10)
+        self.assertEqual(errors, [])
+
+    def test_finished_queries_are_not_cancelled(self):
+        QueryResult('select 1', connections[CONN], 1, 10, 20000, user_id=1, execution_id='done')
+        self.assertFalse(running_queries.cancel('done', user_id=1))
@@ -0,0 +1,98 @@
+from unittest.mock import patch
+
+from django.db import connections, DatabaseError
+from django.test import TestCase
+
+from explorer.app_settings import EXPLORER_DEFAULT_CONNECTION as CONN
+from explorer.cursors import kept_cursors
+from explorer.models import QueryResult
+
+SQL = 'select g from generate_series(1, 10) g'
+
+
+@patch('explorer.app_settings.EXPLORER_PAGING_CURSOR_TTL', 300)
+class TestKeptCursors(TestCase):
+    def tearDown(self):
+        kept_cursors.close_all()
+
+    def _kept(self, sql=SQL):
+        return kept_cursors.get(kept_cursors.key(connections[CONN], 1, sql))
+
+    def test_later_pages_are_fetched_from_the_kept_cursor(self):
+        res = QueryResult(SQL, connections[CONN], 1, 3, 10000, user_id=1)
+        self.assertEqual(res.data, [[1], [2], [3]])
+        self.assertEqual(res.row_count, 10)
+        self.assertIsNone(self._kept())
+
+        res = QueryResult(SQL, connections[CONN], 3, 3, 10000, user_id=1, reuse_cursor=True)
+        self.assertEqual(res.data, [[7], [8], [9]])
+        self.assertEqual(res.row_count, 10)
+        kept = self._kept()
+        self.assertEqual(kept.row_count, 10)
+
+        res = QueryResult(SQL, connections[CONN], 2, 3, 10000, user_id=1, reuse_cursor=True)
+        self.assertEqual(res.data, [[4], [5], [6]])
+        self.assertIs(self._kept(), kept)
+
+    def test_running_again_closes_the_kept_cursor(self):
+        QueryResult(SQL, connections[CONN], 2, 3, 10000, user_id=1, reuse_cursor=True)
+        kept = self._kept()
+        QueryResult(SQL, connections[CONN], 1, 3, 10000, user_id=1)
+        self.assertIsNone(self._kept())
+        self.assertTrue(kept.closed)
+
+    def test_cursors_are_not_kept_without_a_user(self):
+        QueryResult(SQL, connections[CONN], 1, 3, 10000, reuse_cursor=True)
+        self.assertIsNone(self._kept())
+
+    def test_cursors_are_not_kept_when_turned_off(self):
+        with patch('explorer.app_settings.EXPLORER_PAGING_CURSOR_TTL', 0):
+            QueryResult(SQL, connections[CONN], 1, 3, 10000, user_id=1, reuse_cursor=True)
+        self.assertIsNone(self._kept())
+
+    def test_idle_cursors_are_closed(self):
+        QueryResult(SQL, connections[CONN], 1, 3, 10000, user_id=1, reuse_cursor=True)
+        kept = self._kept()
+        kept.last_used -= 301
+        kept_cursors.close_idle()
+        self.assertIsNone(self._kept())
+        self.assertTrue(kept.closed)
+
+    def test_idle_cursors_are_closed_in_the_background(self):
+        QueryResult(SQL, connections[CONN], 1, 3, 10000, user_id=1, reuse_cursor=True)
+        kept = self._kept()
+        kept.last_used -= 301
+        with patch('explorer.cursors.sleep') as sleep:
+            sleep.side_effect = [None, SystemExit]
+            self.assertRaises(SystemExit, kept_cursors._reap)
+        sleep.assert_called_with(150)
+        self.assertTrue(kept.closed)
+
+    def test_processes_that_keep_cursors_start_a_reaper(self):
+        with patch.object(kept_cursors._reaper, 'start') as start_reaper:
+            QueryResult(SQL, connections[CONN], 1, 3, 10000, user_id=1, reuse_cursor=True)
+        start_reaper.assert_called_once_with()
+
+    @patch('explorer.app_settings.EXPLORER_PAGING_CURSOR_MAX', 1)
+    def test_least_recently_used_cursors_are_closed(self):
+        other_sql = 'select 1'
+        QueryResult(other_sql, connections[CONN], 1, 3, 10000, user_id=1, reuse_cursor=True)
+        QueryResult(SQL, connections[CONN], 1, 3, 10000, user_id=1, reuse_cursor=True)
+        kept_cursors.close_idle()
+        self.assertIsNone(self._kept(other_sql))
+        self.assertIsNotNone(self._kept())
+
+    def test_failed_cursors_are_discarded(self):
+        sql = 'select foo from bar'
+        self.assertRaises(
+            DatabaseError,
+            QueryResult,
+            sql,
+            connections[CONN],
+            1,
+            3,
+            10000,
+            user_id=1,
+            reuse_cursor=True,
+        )
+        self.assertIsNone(self._kept(sql))
@@ -1,5 +1,6 @@
 import json
 from datetime import date, datetime
+from unittest.mock import patch
 
 from django.core.serializers.json import DjangoJSONEncoder
 from django.db import connections
@@ -35,6 +36,21 @@ class TestCsv(TestCase):
         res = exporter.get_output(delim='|')
         self.assertEqual(res, '?column?|?column?\r\n1|2\r\n')
 
+    @patch('explorer.app_settings.EXPLORER_STREAMING_FETCH_SIZE', 2)
+    def test_streaming_output(self):
+        q = SimpleQueryFactory(sql='select g as "a", g * 2 as "b" from generate_series(1, 5) g')
+        exporter = CSVExporter(query=q)
+        chunks = list(exporter.get_streaming_output(delim='|'))
+        self.assertEqual(chunks[0], 'a|b\r\n1|2\r\n2|4\r\n')
+        self.assertEqual(''.join(chunks), 'a|b\r\n1|2\r\n2|4\r\n3|6\r\n4|8\r\n5|10\r\n')
+
+    @patch('explorer.app_settings.EXPLORER_CSV_COPY_EXPORTS', True)
+    def test_streaming_output_uses_copy(self):
+        q = SimpleQueryFactory(sql='select g as "a", g > 1 as "b" from generate_series(1, 3) g;')
+        exporter = CSVExporter(query=q)
+        res = b''.join(exporter.get_streaming_output(delim='tab'))
+        self.assertEqual(res, b'a\tb\n1\tf\n2\tt\n3\tt\n')
+
 
 class TestJson(TestCase):
     def test_writing_json(self):
@@ -69,6 +85,18 @@ class TestJson(TestCase):
         expected = [{'a': 1, 'b': date.today()}]
         self.assertEqual(res, json.dumps(expected, cls=DjangoJSONEncoder))
 
+    @patch('explorer.app_settings.EXPLORER_STREAMING_FETCH_SIZE', 2)
+    def test_streaming_output(self):
+        q = SimpleQueryFactory(sql='select g as "a", null as "b" from generate_series(1, 3) g')
+        res = ''.join(JSONExporter(query=q).get_streaming_output())
+        expected = [{'a': 1, 'b': None}, {'a': 2, 'b': None}, {'a': 3, 'b': None}]
+        self.assertEqual(res, json.dumps(expected))
+
+    def test_streaming_output_no_rows(self):
+        q = SimpleQueryFactory(sql='select 1 as "a" where false')
+        res = ''.join(JSONExporter(query=q).get_streaming_output())
+        self.assertEqual(res, '[]')
+
 
 class TestExcel(TestCase):
     def test_writing_excel(self):
@@ -122,3 +150,8 @@ class TestExcel(TestCase):
         expected = b('PK')
 
         self.assertEqual(res[:2], expected)
+
+    def test_streaming_output(self):
+        q = SimpleQueryFactory(sql='select g as "a", now() as "b" from generate_series(1, 3) g')
+        res = b''.join(ExcelExporter(query=q).get_streaming_output())
+        self.assertEqual(res[:2], b('PK'))
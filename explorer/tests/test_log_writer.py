@@ -0,0 +1,73 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.db import connections, DatabaseError
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from explorer.log_writer import log_writer
+from explorer.models import QueryLog
+from explorer.tests.factories import SimpleQueryFactory
+
+
+class TestQueryLogWriting(TestCase):
+    def test_logs_are_written_once_with_their_duration(self):
+        query = SimpleQueryFactory(sql='select 1')
+        with CaptureQueriesContext(connections['default']) as ctx:
+            res, ql = query.execute_with_logging(None, 1, 10, 10000)
+        log_writes = [q for q in ctx.captured_queries if 'explorer_querylog' in q['sql']]
+        self.assertEqual(len(log_writes), 1)
+        self.assertEqual(QueryLog.objects.get().duration, res.duration)
+
+    def test_failed_queries_are_logged(self):
+        query = SimpleQueryFactory(sql='select foo from bar')
+        self.assertRaises(DatabaseError, query.execute_with_logging, None, 1, 10, 10000)
+        self.assertIsNone(QueryLog.objects.get().duration)
+
+
+@patch('explorer.app_settings.EXPLORER_QUERY_LOG_FLUSH_INTERVAL', 60)
+@patch.object(log_writer._flusher, 'start')
+class TestWriteBehindQueryLogs(TestCase):
+    def tearDown(self):
+        log_writer._pending = []
+
+    def test_logs_are_written_when_flushed(self, _):
+        query = SimpleQueryFactory(sql='select 1')
+        res, ql = query.execute_with_logging(None, 1, 10, 10000)
+        self.assertIsNone(ql.id)
+        self.assertEqual(QueryLog.objects.count(), 0)
+        log_writer.flush()
+        log = QueryLog.objects.get()
+        self.assertEqual(log.query, query)
+        self.assertEqual(log.duration, res.duration)
+        self.assertEqual(query.get_run_count(), 1)
+
+    def test_logs_keep_the_time_they_were_made(self, _):
+        ql = SimpleQueryFactory().log(save=False)
+        ql.run_at -= timedelta(minutes=5)
+        log_writer.save(ql)
+        log_writer.flush()
+        self.assertLess(QueryLog.objects.get().run_at, timezone.now() - timedelta(minutes=4))
+
+    @patch('explorer.app_settings.EXPLORER_QUERY_LOG_MAX_PENDING', 2)
+    def test_logs_are_kept_when_they_cant_be_written(self, _):
+        query = SimpleQueryFactory()
+        for _ in range(3):
+            log_writer.save(query.log(save=False))
+        with patch('explorer.models.QueryLog.objects.bulk_create', side_effect=DatabaseError):
+            log_writer.flush()
+        self.assertEqual(len(log_writer._pending), 2)
+        log_writer.flush()
+        self.assertEqual(QueryLog.objects.count(), 2)
+        self.assertEqual(query.get_run_count(), 2)
+
+    @patch('explorer.app_settings.EXPLORER_QUERY_LOG_BATCH_SIZE', 2)
+    def test_full_batches_wake_the_flusher(self, _):
+        query = SimpleQueryFactory()
+        log_writer._wake.clear()
+        log_writer.save(query.log(save=False))
+        self.assertFalse(log_writer._wake.is_set())
+        log_writer.save(query.log(save=False))
+        self.assertTrue(log_writer._wake.is_set())
+        log_writer._wake.clear()
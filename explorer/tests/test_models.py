@@ -1,15 +1,36 @@
-from unittest.mock import call, Mock
+from decimal import Decimal
+from unittest.mock import call, Mock, patch
 
 import six
-from django.db import connections
-from django.test import TestCase
+from django.core.cache import cache
+from django.db import connections, DatabaseError
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from explorer.app_settings import EXPLORER_DEFAULT_CONNECTION as CONN
-from explorer.models import ColumnHeader, ColumnSummary, Query, QueryLog, QueryResult, SQLQuery
+from explorer.log_writer import log_writer
+from explorer.models import (
+    ColumnHeader,
+    ColumnSummary,
+    CopyQueryResult,
+    Query,
+    QueryJob,
+    QueryLog,
+    QueryResult,
+    QueryStats,
+    SQLQuery,
+    StreamingQueryResult,
+)
 from explorer.tests.factories import SimpleQueryFactory
 
 
 class TestQueryModel(TestCase):
+    def test_execute_leaves_the_stats_to_be_asked_for(self):
+        res = SimpleQueryFactory(sql="select 1 as a, 'b' as b;").execute(1, 10, 10000)
+        self.assertTrue(res.has_stats)
+        self.assertIsNone(res.headers[0].summary)
+
     def test_params_get_merged(self):
         q = SimpleQueryFactory(sql="select '$$foo$$';")
         q.params = {'foo': 'bar', 'mux': 'qux'}
@@ -56,14 +77,45 @@ class TestQueryModel(TestCase):
         q = SimpleQueryFactory()
         self.assertIsNone(q.avg_duration())
         expected = 2.5
-        ql = q.log()
-        ql.duration = 2
-        ql.save()
-        ql = q.log()
-        ql.duration = 3
-        ql.save()
+        for duration in (2, 3):
+            ql = q.log(save=False)
+            ql.duration = duration
+            log_writer.save(ql)
         self.assertEqual(q.avg_duration(), expected)
 
+    def test_run_stats(self):
+        q = SimpleQueryFactory(sql='select 1 union select 2')
+        for _ in range(3):
+            q.execute_with_logging(None, 1, 10, 10000)
+        q.log()
+        stats = QueryStats.objects.get(query=q)
+        self.assertEqual(stats.run_count, 4)
+        self.assertEqual(stats.finished_count, 3)
+        self.assertEqual(stats.avg_rows, 2)
+        self.assertEqual(stats.last_run_at, QueryLog.objects.latest('run_at').run_at)
+
+    def test_duration_percentiles(self):
+        query = SimpleQueryFactory()
+        QueryStats.record(
+            [QueryLog(query=query, run_at=timezone.now(), duration=d) for d in [3] * 9 + [1000]]
+        )
+        stats = QueryStats.objects.get(query=query)
+        self.assertEqual(stats.finished_count, 10)
+        self.assertEqual(stats.duration_percentile(50), 4)
+        self.assertEqual(stats.duration_percentile(90), 4)
+        self.assertGreaterEqual(stats.duration_percentile(99), 1000)
+        self.assertLess(stats.duration_percentile(99), 1000 * 1.5)
+        self.assertIsNone(QueryStats().duration_percentile(50))
+
+    def test_stats_are_added_to_without_locking_them(self):
+        query = SimpleQueryFactory()
+        QueryStats.record([QueryLog(query=query, run_at=timezone.now(), duration=3)])
+        with CaptureQueriesContext(connections['default']) as ctx:
+            QueryStats.record([QueryLog(query=query, run_at=timezone.now(), duration=3)])
+        self.assertEqual([q['sql'].split()[0] for q in ctx.captured_queries], ['UPDATE'] * 2)
+        self.assertEqual(QueryStats.objects.get(query=query).run_count, 2)
+        self.assertEqual(query.stats.duration_buckets.get().count, 2)
+
     def test_log_saves_duration(self):
         q = SimpleQueryFactory()
         res, ql = q.execute_with_logging(None, None, 10, 10000)
@@ -77,6 +129,22 @@ class TestQueryModel(TestCase):
         expected = "select 'bar', 'mux';"
         self.assertEqual(q.final_sql(), expected)
 
+    def test_quoted_params_are_bound(self):
+        q = SimpleQueryFactory(sql="select '$$foo$$' as a, $$bar$$ as b where 'x' like '%';")
+        q.params = {'foo': "it's", 'bar': '1'}
+        self.assertEqual(q.bound_sql(), ("select %s as a, 1 as b where 'x' like '%%';", ["it's"]))
+        self.assertEqual(q.execute(1, 10, 10000).data, [["it's", 1]])
+        self.assertEqual(b''.join(q.execute_csv_copy(10000, '%').chunks()), b"a%b\nit's%1\n")
+        self.assertEqual(list(q.execute_streaming(10000, 10).batches()), [[("it's", 1)]])
+
+    @patch('explorer.app_settings.EXPLORER_RESULT_CACHE_TTL', 60)
+    def test_results_are_cached_by_param_value(self):
+        cache.clear()
+        q = SimpleQueryFactory(sql="select '$$foo$$';")
+        for value in ['a', 'b', 'a']:
+            q.params = {'foo': value}
+            self.assertEqual(q.execute(1, 10, 10000).data, [[value]])
+
     def test_cant_query_with_unregistered_connection(self):
         from explorer.utils import InvalidExplorerConnectionException
 
@@ -128,6 +196,17 @@ class _AbstractQueryResults:
     def test_numeric_detection(self):
         self.assertEqual(self.qr._get_numerics(), [0])
 
+    def test_numeric_detection_uses_column_types(self):
+        conn = connections[self.connection_name]
+        sql = "select -1 as a, 1.5::numeric as b, 2.5::float as c, '1' as d, true as e;"
+        qr = QueryResult(sql, conn, 1, 1000, 10000)
+        self.assertEqual(qr._get_numerics(), [0, 1, 2])
+
+    def test_numeric_detection_skips_leading_nulls(self):
+        self.qr._description = [("a",), ("b",)]
+        self.qr._data = [[None, None], [1.5, "x"]]
+        self.assertEqual(self.qr._get_numerics(), [0])
+
     def test_get_headers_no_results(self):
         self.qr._description = None
         self.assertEqual([ColumnHeader('--')][0].title, self.qr._get_headers()[0].title)
@@ -138,6 +217,184 @@ class TestQueryResults(_AbstractQueryResults, TestCase):
     connection_name = CONN
 
 
+@patch('explorer.app_settings.EXPLORER_FULL_RESULT_STATS', True)
+class TestFullResultStats(TestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def _result(self, sql, limit=10):
+        res = QueryResult(sql, connections[CONN], 1, limit, 10000)
+        res.process()
+        return res
+
+    def test_stats_cover_the_whole_result(self):
+        sql = 'select g as a, nullif(g, 5) * 2 as a, g::text from generate_series(1, 25) g;'
+        res = self._result(sql)
+        self.assertTrue(res.stats_cover_full_result)
+        self.assertEqual(
+            res.headers[0].summary.stats, {'Sum': 325, 'Avg': 13, 'Min': 1, 'Max': 25, 'NUL': 0}
+        )
+        self.assertEqual(
+            res.headers[1].summary.stats, {'Sum': 640, 'Avg': 25.6, 'Min': 0, 'Max': 50, 'NUL': 1}
+        )
+        self.assertIsNone(res.headers[2].summary)
+
+    def test_stats_are_cached(self):
+        sql = 'select g from generate_series(1, 25) g'
+        self._result(sql)
+        with CaptureQueriesContext(connections[CONN]) as ctx:
+            res = self._result(sql)
+        self.assertFalse(any('sum(' in q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(res.headers[0].summary.stats['Sum'], 325)
+
+    def test_sql_ending_in_a_comment(self):
+        res = self._result('select g from generate_series(1, 25) g\n-- the last line')
+        self.assertTrue(res.stats_cover_full_result)
+        self.assertEqual(res.headers[0].summary.stats['Sum'], 325)
+
+    def test_results_that_fit_on_the_page_are_summarised_in_python(self):
+        res = self._result('select g from generate_series(1, 25) g', limit=100)
+        self.assertFalse(res.stats_cover_full_result)
+        self.assertEqual(res.headers[0].summary.stats['Sum'], 325)
+
+
+class TestStreamingQueryResult(TestCase):
+    def test_fetches_in_batches(self):
+        sql = 'select g as "foo" from generate_series(1, 5) g'
+        res = StreamingQueryResult(sql, connections[CONN], 10000, 2)
+        self.assertEqual(res.header_strings, ['foo'])
+        batches = list(res.batches())
+        self.assertEqual(batches[:3], [[(1,), (2,)], [(3,), (4,)], [(5,)]])
+        self.assertEqual(len(batches), 3)
+
+    def test_timeout_is_reset_afterwards(self):
+        with connections[CONN].cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            timeout = cursor.fetchone()[0]
+            b''.join(CopyQueryResult('select 1', connections[CONN], 12345, ',').chunks())
+            cursor.execute('SHOW statement_timeout')
+            self.assertEqual(cursor.fetchone()[0], timeout)
+
+    def test_errors_are_raised_on_creation(self):
+        from django.db import DatabaseError
+
+        self.assertRaises(
+            DatabaseError, StreamingQueryResult, 'select foo from bar', connections[CONN], 10000, 2
+        )
+
+    def test_close_ends_the_transaction(self):
+        conn = connections[CONN]
+        depth = len(conn.savepoint_ids)
+        res = StreamingQueryResult('select 1', conn, 10000, 2)
+        self.assertEqual(len(conn.savepoint_ids), depth + 1)
+        res.close()
+        self.assertEqual(len(conn.savepoint_ids), depth)
+
+
+class TestCopyQueryResult(TestCase):
+    def test_chunks(self):
+        sql = 'select g as "foo" from generate_series(1, 3) g'
+        res = CopyQueryResult(sql, connections[CONN], 10000, ',')
+        self.assertEqual(b''.join(res.chunks()), b'foo\n1\n2\n3\n')
+
+    def test_sql_ending_in_a_comment(self):
+        sql = 'select g as "foo" from generate_series(1, 2) g\n-- the last line'
+        res = CopyQueryResult(sql, connections[CONN], 10000, ',')
+        self.assertEqual(b''.join(res.chunks()), b'foo\n1\n2\n')
+
+    def test_timeout_is_reset_afterwards(self):
+        with connections[CONN].cursor() as cursor:
+            cursor.execute('SHOW statement_timeout')
+            timeout = cursor.fetchone()[0]
+            b''.join(CopyQueryResult('select 1', connections[CONN], 12345, ',').chunks())
+            cursor.execute('SHOW statement_timeout')
+            self.assertEqual(cursor.fetchone()[0], timeout)
+
+    def test_errors_are_raised_on_creation(self):
+        from django.db import DatabaseError
+
+        self.assertRaises(
+            DatabaseError, CopyQueryResult, 'select foo from bar', connections[CONN], 10000, ','
+        )
+
+    def test_close_cancels_the_copy(self):
+        sql = 'select repeat(\'x\', 1000) from generate_series(1, 10000000)'
+        res = CopyQueryResult(sql, connections[CONN], 60000, ',')
+        next(res.chunks())
+        res.close()
+        self.assertFalse(res._thread.is_alive())
+
+
+class TestQueryJob(TestCase):
+    def _job(self, sql='select g from generate_series(1, 25) g'):
+        return QueryJob.objects.create(sql=sql, connection=CONN, page=2, limit=10)
+
+    def test_running_a_job_keeps_its_result(self):
+        job = self._job()
+        job.run()
+        job.refresh_from_db()
+        self.assertEqual(job.status, QueryJob.SUCCEEDED)
+        self.assertIsNotNone(job.finished_at)
+        res = job.result()
+        self.assertEqual(res.data, [[g] for g in range(11, 21)])
+        self.assertEqual(res.row_count, 25)
+        self.assertEqual(res.header_strings, ['g'])
+
+    def test_failed_jobs_keep_the_error(self):
+        job = self._job('select foo from bar')
+        job.run()
+        job.refresh_from_db()
+        self.assertEqual(job.status, QueryJob.FAILED)
+        self.assertIn('bar', job.error)
+        self.assertIsNone(job.result())
+
+    def test_jobs_that_fail_otherwise_are_marked_failed(self):
+        job = self._job()
+        with patch('explorer.models.cache.set', side_effect=ValueError('no cache')):
+            self.assertRaises(ValueError, job.run)
+        job.refresh_from_db()
+        self.assertEqual(job.status, QueryJob.FAILED)
+        self.assertEqual(job.error, 'no cache')
+
+    def test_job_runs_are_added_to_the_query_stats(self):
+        query = SimpleQueryFactory(sql='select g from generate_series(1, 25) g')
+        # The task to run it is only sent on commit
+        job = QueryJob.submit(query, None, 2, 10)
+        self.assertEqual(query.get_run_count(), 0)
+        job.run()
+        stats = QueryStats.objects.get(query=query)
+        self.assertEqual(stats.run_count, 1)
+        self.assertEqual(stats.avg_rows, 25)
+        self.assertEqual(stats.avg_duration, QueryLog.objects.get().duration)
+
+    def test_jobs_bind_their_params(self):
+        query = SimpleQueryFactory(sql="select '$$foo$$' as foo")
+        query.params = {'foo': "it's"}
+        job = QueryJob.submit(query, None, 1, 10)
+        job.refresh_from_db()
+        self.assertEqual(job.sql, query.sql)
+        job.run()
+        job.refresh_from_db()
+        self.assertEqual(job.status, QueryJob.SUCCEEDED)
+        self.assertEqual(job.result().data, [["it's"]])
+        self.assertEqual(job.query().available_params(), {'foo': "it's"})
+
+    def test_cancelled_jobs_are_not_run(self):
+        job = self._job()
+        self.assertTrue(job.cancel())
+        job.run()
+        job.refresh_from_db()
+        self.assertEqual(job.status, QueryJob.CANCELLED)
+        self.assertIsNone(job.result())
+
+    def test_finished_jobs_cannot_be_cancelled(self):
+        job = self._job()
+        job.run()
+        self.assertFalse(job.cancel())
+        job.refresh_from_db()
+        self.assertEqual(job.status, QueryJob.SUCCEEDED)
+
+
 class TestColumnSummary(TestCase):
     def test_executes(self):
         res = ColumnSummary('foo', [1, 2, 3])
@@ -147,6 +404,10 @@ class TestColumnSummary(TestCase):
         res = ColumnSummary('foo', [1, None, 5])
         self.assertEqual(res.stats, {'Min': 0, 'Max': 5, 'Avg': 2, 'Sum': 6, 'NUL': 1})
 
+    def test_negatives_and_decimals(self):
+        res = ColumnSummary('foo', [Decimal('-1.5'), None, Decimal('4.25')])
+        self.assertEqual(res.stats, {'Min': -1.5, 'Max': 4.25, 'Avg': 0.92, 'Sum': 2.75, 'NUL': 1})
+
     def test_empty_data(self):
         res = ColumnSummary('foo', [])
         self.assertEqual(res.stats, {'Min': 0, 'Max': 0, 'Avg': 0, 'Sum': 0, 'NUL': 0})
@@ -164,8 +425,102 @@ class TestSQLQuery(TestCase):
         query.execute()
 
         expected_calls = [
-            call("SET statement_timeout = 10000"),
-            call("DECLARE test_cursor CURSOR WITH HOLD FOR select * from foo"),
-            call("FETCH 100 FROM test_cursor"),
+            call(
+                "SET LOCAL statement_timeout = 10000"
+                "\n;DECLARE test_cursor CURSOR FOR select * from foo"
+                "\n;FETCH 100 FROM test_cursor",
+                None,
+            ),
         ]
         mock_execute.assert_has_calls(expected_calls)
+
+    def test_later_pages_move_past_the_earlier_rows(self):
+        mock_cursor = Mock()
+        mock_cursor.db.vendor = 'postgresql'
+        mock_cursor.rowcount = 200
+
+        query = SQLQuery(mock_cursor, "select * from foo -- comment", 100, 3, 10000)
+        query._cursor_name = "test_cursor"
+        query.execute()
+
+        mock_cursor.execute.assert_has_calls(
+            [
+                call(
+                    "SET LOCAL statement_timeout = 10000"
+                    "\n;DECLARE test_cursor CURSOR FOR select * from foo -- comment"
+                    "\n;MOVE 200 FROM test_cursor",
+                    None,
+                ),
+                call("FETCH 100 FROM test_cursor", None),
+            ]
+        )
+        self.assertEqual(query._skipped, 200)
+
+    def test_count_comes_from_the_cursor(self):
+        conn = connections[CONN]
+        sql = 'select g from generate_series(1, 25) g'
+        for page, expected_rows in [(1, 10), (3, 5), (5, 0)]:
+            with CaptureQueriesContext(conn) as ctx, conn.cursor() as cursor:
+                query = SQLQuery(cursor, sql, 10, page, 10000)
+                self.assertEqual(len(query.get_results()), expected_rows)
+                self.assertEqual(query.count, 25)
+            self.assertFalse(any('count(*)' in q['sql'] for q in ctx.captured_queries))
+
+    def test_page_is_read_inside_a_transaction(self):
+        conn = connections[CONN]
+        with CaptureQueriesContext(conn) as ctx, conn.cursor() as cursor:
+            query = SQLQuery(cursor, 'select g from generate_series(1, 25) g', 10, 1, 10000)
+            query.get_results()
+        sql = [q['sql'] for q in ctx.captured_queries]
+        self.assertFalse(any('WITH HOLD' in q for q in sql))
+        self.assertTrue(sql[0].startswith('SAVEPOINT'))
+        self.assertTrue(sql[-2].startswith('CLOSE'))
+
+    def test_first_page_is_read_in_one_statement(self):
+        conn = connections[CONN]
+        sql = 'select g from generate_series(1, 25) g -- a comment'
+        with CaptureQueriesContext(conn) as ctx, conn.cursor() as cursor:
+            query = SQLQuery(cursor, sql, 30, 1, 10000)
+            self.assertEqual(len(query.get_results()), 25)
+        sql = [q['sql'] for q in ctx.captured_queries]
+        self.assertEqual(len(sql), 4)
+        self.assertIn('DECLARE', sql[1])
+        self.assertIn('FETCH 30', sql[1])
+
+    def test_cursor_is_closed_after_a_failure(self):
+        conn = connections[CONN]
+        with conn.cursor() as cursor:
+            sql = 'select 1 / (g - 20) from generate_series(1, 25) g'
+            query = SQLQuery(cursor, sql, 10, 1, 10000)
+            self.assertRaises(DatabaseError, query.get_results)
+            cursor.execute('SELECT count(*) FROM pg_cursors')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_count_stops_at_the_threshold(self):
+        conn = connections[CONN]
+        sql = 'select g from generate_series(1, 25) g'
+        with conn.cursor() as cursor:
+            query = SQLQuery(cursor, sql, 3, 1, 10000, count_threshold=5)
+            self.assertEqual(len(query.get_results()), 3)
+            self.assertTrue(query.count_is_estimate)
+            self.assertGreaterEqual(query.count, 6)
+
+    def test_count_below_the_threshold_is_exact(self):
+        conn = connections[CONN]
+        sql = 'select g from generate_series(1, 25) g'
+        with conn.cursor() as cursor:
+            query = SQLQuery(cursor, sql, 10, 1, 10000, count_threshold=100)
+            query.get_results()
+            self.assertFalse(query.count_is_estimate)
+            self.assertEqual(query.count, 25)
+
+
+class TestSQLQueryOutsideTransactions(TransactionTestCase):
+    def test_cursor_is_closed_by_the_commit(self):
+        conn = connections[CONN]
+        with CaptureQueriesContext(conn) as ctx, conn.cursor() as cursor:
+            query = SQLQuery(cursor, 'select g from generate_series(1, 25) g', 10, 1, 10000)
+            query.get_results()
+            cursor.execute('SELECT count(*) FROM pg_cursors')
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertFalse(any(q['sql'].startswith('CLOSE') for q in ctx.captured_queries))
@@ -0,0 +1,78 @@
+import copy
+from unittest.mock import patch
+
+from django.db import connections, OperationalError
+from django.test import TestCase
+from sqlalchemy import inspect
+
+from explorer.app_settings import EXPLORER_DEFAULT_CONNECTION as CONN
+from explorer.models import Query
+from explorer.pool import pools
+from explorer.pooled_postgresql.base import DatabaseWrapper
+
+
+class TestPooledConnections(TestCase):
+    def tearDown(self):
+        pools.dispose_all()
+
+    def _connection(self):
+        return DatabaseWrapper(copy.deepcopy(connections[CONN].settings_dict), CONN)
+
+    def _query(self, connection, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.fetchone()[0]
+
+    def test_connections_are_reused(self):
+        connection = self._connection()
+        pid = self._query(connection, 'SELECT pg_backend_pid()')
+        connection.close()
+        connection = self._connection()
+        self.assertEqual(self._query(connection, 'SELECT pg_backend_pid()'), pid)
+        self.assertEqual(pools.metrics()[CONN]['checked_out'], 1)
+        connection.close()
+        self.assertEqual(pools.metrics()[CONN]['checked_out'], 0)
+
+    def test_session_state_is_reset(self):
+        connection = self._connection()
+        with connection.cursor() as cursor:
+            cursor.execute('SET statement_timeout = 1234')
+            cursor.execute('DECLARE held CURSOR WITH HOLD FOR SELECT 1')
+        connection.close()
+        connection = self._connection()
+        self.assertNotEqual(self._query(connection, 'SHOW statement_timeout'), '1234ms')
+        self.assertEqual(self._query(connection, 'SELECT count(*) FROM pg_cursors'), 0)
+        connection.close()
+
+    @patch('explorer.app_settings.EXPLORER_POOL_SIZE', 1)
+    @patch('explorer.app_settings.EXPLORER_POOL_MAX_OVERFLOW', 0)
+    @patch('explorer.app_settings.EXPLORER_POOL_TIMEOUT', 0.1)
+    def test_pools_are_bounded(self):
+        first = self._connection()
+        first.ensure_connection()
+        second = self._connection()
+        self.assertRaises(OperationalError, second.ensure_connection)
+        first.close()
+        second.ensure_connection()
+        second.close()
+
+    def test_dropped_connections_are_replaced(self):
+        connection = self._connection()
+        pid = self._query(connection, 'SELECT pg_backend_pid()')
+        connection.close()
+        self._query(connections[CONN], f'SELECT pg_terminate_backend({pid})')
+        connection = self._connection()
+        self.assertNotEqual(self._query(connection, 'SELECT pg_backend_pid()'), pid)
+        connection.close()
+
+    def test_schema_introspection_shares_the_pool(self):
+        self.assertIs(pools.engine(connections[CONN]).pool, pools.get(connections[CONN]))
+
+    def test_schema_introspection_after_pooled_queries(self):
+        connection = self._connection()
+        self._query(connection, 'SELECT 1')
+        connection.close()
+        engine = pools.engine(connections[CONN])
+        self.assertIsNotNone(engine.dialect.server_version_info)
+        columns = inspect(engine).get_columns(Query._meta.db_table)
+        self.assertIn('sql', [c['name'] for c in columns])
@@ -0,0 +1,74 @@
+from unittest.mock import patch
+
+from django.db import connections, OperationalError
+from django.test import TestCase
+
+from explorer.models import QueryResult
+from explorer.replicas import replicas, ReplicaStatus
+
+
+@patch('explorer.app_settings.EXPLORER_READ_REPLICAS', {'default': ['alt']})
+class TestReplicas(TestCase):
+    databases = ['default', 'alt']
+
+    def setUp(self):
+        replicas.reset()
+
+    def _database(self):
+        res = QueryResult('select current_database()', connections['default'], 1, 10, 20000)
+        return res.data[0][0]
+
+    def test_queries_run_on_replicas(self):
+        self.assertEqual(self._database(), connections['alt'].settings_dict['NAME'])
+
+    def test_connections_without_replicas_are_used_directly(self):
+        self.assertEqual(replicas.choose(connections['alt']), connections['alt'])
+
+    def test_replicas_report_their_lag_and_load(self):
+        status = replicas.status('alt')
+        self.assertTrue(status.available)
+        self.assertEqual(status.lag, 0)
+        self.assertGreaterEqual(status.active, 0)
+
+    def test_lagging_replicas_are_not_used(self):
+        replicas._set_status('alt', ReplicaStatus(lag=3600))
+        self.assertEqual(self._database(), connections['default'].settings_dict['NAME'])
+
+    def test_least_loaded_replica_is_used(self):
+        replicas._set_status('alt', ReplicaStatus(lag=0, active=5))
+        replicas._set_status('default', ReplicaStatus(lag=0, active=1))
+        with patch('explorer.app_settings.EXPLORER_READ_REPLICAS', {'default': ['alt', 'default']}):
+            self.assertEqual(replicas.choose(connections['default']).alias, 'default')
+            with replicas.route(connections['default']):
+                with replicas.route(connections['default']):
+                    with replicas.route(connections['default']):
+                        pass
+                    self.assertEqual(replicas.choose(connections['default']).alias, 'default')
+                replicas._set_status('default', ReplicaStatus(lag=0, active=5))
+                # 5 active and 1 running here, against 5 active
+                self.assertEqual(replicas.choose(connections['default']).alias, 'alt')
+
+    def test_unavailable_replicas_fail_over(self):
+        replicas.status('alt')
+        with patch.object(connections['alt'], 'ensure_connection', side_effect=OperationalError):
+            self.assertEqual(self._database(), connections['default'].settings_dict['NAME'])
+        self.assertFalse(replicas.status('alt').available)
+
+    def test_reads_fail_over_when_a_replica_is_lost(self):
+        tried = []
+
+        def run(connection):
+            tried.append(connection.alias)
+            if connection.alias == 'alt':
+                raise OperationalError('server closed the connection unexpectedly')
+            return connection.alias
+
+        with patch.object(replicas, '_lost', side_effect=lambda c: c.alias == 'alt'):
+            self.assertEqual(replicas.read(connections['default'], run), 'default')
+        self.assertEqual(tried, ['alt', 'default'])
+        self.assertFalse(replicas.status('alt').available)
+
+    def test_reads_that_time_out_are_not_run_again(self):
+        sql = 'select pg_sleep(1)'
+        self.assertRaises(OperationalError, QueryResult, sql, connections['default'], 1, 10, 100)
+        self.assertTrue(replicas.status('alt').available)
@@ -0,0 +1,90 @@
+from unittest.mock import patch
+
+from django.db import connections
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from explorer.app_settings import EXPLORER_DEFAULT_CONNECTION as CONN
+from explorer.models import QueryLog, QueryResult, QueryStats
+from explorer.result_cache import result_cache
+from explorer.tests.factories import SimpleQueryFactory
+
+SQL = 'select g, g * 2 from generate_series(1, 10) g'
+
+
+@patch('explorer.app_settings.EXPLORER_RESULT_CACHE_TTL', 300)
+class TestResultCache(TestCase):
+    def tearDown(self):
+        result_cache.clear()
+
+    def _run(self, sql=SQL, **kwargs):
+        conn = connections[CONN]
+        with CaptureQueriesContext(conn) as ctx:
+            res = QueryResult(sql, conn, 1, 3, 10000, **kwargs)
+        return res, len(ctx.captured_queries)
+
+    def test_results_are_cached(self):
+        first, queries = self._run()
+        self.assertFalse(first.from_cache)
+        self.assertGreater(queries, 0)
+
+        second, queries = self._run()
+        self.assertTrue(second.from_cache)
+        self.assertEqual(queries, 0)
+        self.assertEqual(second.data, [[1, 2], [2, 4], [3, 6]])
+        self.assertEqual(second.header_strings, first.header_strings)
+        self.assertEqual(second.row_count, 10)
+        self.assertEqual(second.duration, first.duration)
+
+    def test_cached_results_are_not_counted_as_runs(self):
+        query = SimpleQueryFactory(sql=SQL)
+        query.execute_with_logging(None, 1, 3, 10000)
+        res, ql = query.execute_with_logging(None, 1, 3, 10000)
+        self.assertTrue(res.from_cache)
+        self.assertTrue(ql.from_cache)
+        self.assertIsNone(ql.duration)
+        self.assertEqual(QueryLog.objects.count(), 2)
+        stats = QueryStats.objects.get(query=query)
+        self.assertEqual(stats.run_count, 1)
+        self.assertEqual(stats.finished_count, 1)
+
+    def test_refresh_runs_the_query_again(self):
+        self._run()
+        res, queries = self._run(refresh_cache=True)
+        self.assertFalse(res.from_cache)
+        self.assertGreater(queries, 0)
+        self.assertTrue(self._run()[0].from_cache)
+
+    def test_results_are_not_cached_when_turned_off(self):
+        with patch('explorer.app_settings.EXPLORER_RESULT_CACHE_TTL', 0):
+            self._run()
+        self.assertFalse(self._run()[0].from_cache)
+
+    @patch('explorer.app_settings.EXPLORER_RESULT_CACHE_MAX_ROWS', 2)
+    def test_large_results_are_not_cached(self):
+        self._run()
+        self.assertFalse(self._run()[0].from_cache)
+
+    @patch('explorer.app_settings.EXPLORER_RESULT_CACHE_MAX_ENTRIES', 1)
+    def test_oldest_results_are_evicted(self):
+        other_sql = 'select 1'
+        self._run(other_sql)
+        self._run()
+        self.assertFalse(self._run(other_sql)[0].from_cache)
+        self.assertFalse(self._run()[0].from_cache)
+
+    def test_queries_can_set_their_own_ttl(self):
+        query = SimpleQueryFactory(sql=SQL, result_cache_ttl=0)
+        query.execute(1, 3, 10000)
+        self.assertFalse(query.execute(1, 3, 10000).from_cache)
+
+        query = SimpleQueryFactory(sql=SQL, result_cache_ttl=60)
+        with patch('explorer.result_cache.cache.set') as cache_set:
+            query.execute(1, 3, 10000)
+        self.assertEqual(cache_set.call_args_list[0][0][2], 60)
+
+    def test_queries_without_a_ttl_use_the_default(self):
+        query = SimpleQueryFactory(sql=SQL)
+        with patch('explorer.result_cache.cache.set') as cache_set:
+            query.execute(1, 3, 10000)
+        self.assertEqual(cache_set.call_args_list[0][0][2], 300)
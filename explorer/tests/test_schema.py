@@ -5,12 +5,17 @@ from django.test import TestCase
 
 from explorer import schema
 from explorer.app_settings import EXPLORER_CONNECTIONS
+from explorer.pool import pools
 
 
 class TestSchemaInfo(TestCase):
     def setUp(self):
         cache.clear()
 
+    def tearDown(self):
+        # Close the pooled connections so they don't hold the test database open
+        pools.dispose_all()
+
     @patch('explorer.schema._get_includes')
     @patch('explorer.schema._get_excludes')
     def test_schema_info_returns_valid_data(self, mocked_excludes, mocked_includes):
@@ -2,9 +2,10 @@ from datetime import datetime, timedelta
 from unittest.mock import patch
 
 from django.test import TestCase
+from django.utils import timezone
 
 from explorer.app_settings import EXPLORER_DEFAULT_CONNECTION as CONN
-from explorer.models import QueryLog
+from explorer.models import QueryJob, QueryLog
 from explorer.tasks import build_schema_cache_async, truncate_querylogs
 
 
@@ -17,6 +18,31 @@ class TestTasks(TestCase):
         truncate_querylogs(30)
         self.assertEqual(QueryLog.objects.count(), 1)
 
+    @patch('explorer.app_settings.EXPLORER_QUERY_LOG_DELETE_BATCH_SIZE', 2)
+    def test_truncating_querylogs_in_batches(self):
+        for _ in range(5):
+            QueryLog(sql='foo', run_at=timezone.now() - timedelta(days=31)).save()
+        QueryLog(sql='bar').save()
+        job = QueryJob.objects.create(
+            sql='foo', query_log=QueryLog.objects.filter(sql='foo').first(), limit=10
+        )
+        # The first batch finds no jobs to delete
+        with self.assertNumQueries(3 + 5 * 3 + 3):
+            truncate_querylogs(30)
+        self.assertEqual(list(QueryLog.objects.values_list('sql', flat=True)), ['bar'])
+        job.refresh_from_db()
+        self.assertIsNone(job.query_log)
+
+    @patch('explorer.app_settings.EXPLORER_QUERY_LOG_DELETE_BATCH_SIZE', 2)
+    def test_truncating_querylogs_deletes_old_jobs(self):
+        for sql in ('foo', 'foo', 'foo', 'bar'):
+            QueryJob.objects.create(sql=sql, query_log=QueryLog.objects.create(sql=sql), limit=10)
+        QueryJob.objects.filter(sql='foo').update(created_at=timezone.now() - timedelta(days=31))
+        QueryLog.objects.filter(sql='foo').update(run_at=timezone.now() - timedelta(days=31))
+        truncate_querylogs(30)
+        self.assertEqual(list(QueryJob.objects.values_list('sql', flat=True)), ['bar'])
+        self.assertEqual(list(QueryLog.objects.values_list('sql', flat=True)), ['bar'])
+
     @patch('explorer.schema.build_schema_info')
     @patch('explorer.schema.cache.set')
     def test_build_schema_cache_async(self, _, mocked_build):
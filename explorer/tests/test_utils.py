@@ -1,15 +1,18 @@
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 from django.test import TestCase
 
 from explorer.tests.factories import SimpleQueryFactory
 from explorer.utils import (
+    bind_params,
     EXPLORER_PARAM_TOKEN,
     extract_params,
     get_params_for_url,
     get_params_from_request,
+    get_sql_template,
     get_total_pages,
     param,
+    ProcessThread,
     shared_dict_update,
     swap_params,
 )
@@ -40,6 +43,30 @@ class TestParams(TestCase):
         got = swap_params(sql, params)
         self.assertEqual(got, expected)
 
+    def test_quoted_params_get_bound(self):
+        sql = "select '$$this$$', '$$that:x$$ %', $$this$$, '$$other$$' where a like '%'"
+        params = {'this': 'here', 'THAT': 1}
+        expected = "select %s, '1 %%', here, '$$other$$' where a like '%%'"
+        self.assertEqual(bind_params(sql, params), (expected, ['here']))
+
+    def test_params_only_get_bound_when_quoted(self):
+        sql = "select $$this$$ where a like '%'"
+        self.assertEqual(bind_params(sql, {'this': 1}), ("select 1 where a like '%'", []))
+        self.assertEqual(bind_params(sql, None), (sql, []))
+
+    def test_templates_are_parsed_once(self):
+        sql = "select '$$this:a$$', $$that$$ from $$this$$"
+        template = get_sql_template(sql)
+        self.assertIs(get_sql_template(sql), template)
+        self.assertEqual(template.params, {'this': '', 'that': ''})
+        self.assertEqual([t.name for t in template.tokens], ['this', 'that', 'this'])
+        self.assertEqual(template.texts, ['select ', ', ', ' from ', ''])
+
+    def test_swapped_values_are_not_swapped_again(self):
+        sql = 'please swap $$this$$ and $$that$$'
+        params = {'this': '$$that$$', 'that': 'there'}
+        self.assertEqual(swap_params(sql, params), 'please swap $$that$$ and there')
+
     def _assertSwap(self, tuple):
         self.assertEqual(extract_params(tuple[0]), tuple[1])
 
@@ -115,3 +142,17 @@ class TestGetTotalPages(TestCase):
                 expected_total_pages,
                 msg=f'Total rows {total_rows}, Page size {page_size}',
             )
+
+
+class TestProcessThread(TestCase):
+    def test_threads_are_started_once_in_each_process(self):
+        target = Mock()
+        thread = ProcessThread(target)
+        with patch('explorer.utils.threading.Thread') as Thread:
+            thread.start()
+            thread.start()
+            self.assertEqual(Thread.call_count, 1)
+            Thread.assert_called_with(target=target, daemon=True)
+            with patch('explorer.utils.os.getpid', return_value=-1):
+                thread.start()
+            self.assertEqual(Thread.call_count, 2)
@@ -1,19 +1,30 @@
 import json
 import time
+from datetime import timedelta
+from unittest.mock import patch
 
 from django.contrib.auth.models import User
+from django.db import connection
 from django.forms.models import model_to_dict
 from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 try:
     from django.urls import reverse
 except ImportError:
     from django.core.urlresolvers import reverse
 
-from explorer.models import Query, QueryLog
+from explorer.models import Query, QueryJob, QueryLog
+from explorer.result_cache import result_cache
 from explorer.tests.factories import QueryLogFactory, SimpleQueryFactory
 
 
+def query_form_data(query):
+    # The fields of a query as its forms post them, leaving out those only set in the admin
+    return model_to_dict(query, exclude=['result_cache_ttl'])
+
+
 class TestQueryListView(TestCase):
     def setUp(self):
         self.user = User.objects.create_superuser('admin', 'admin@admin.com', 'pwd')
@@ -36,6 +47,49 @@ class TestQueryListView(TestCase):
         resp = self.client.get(reverse("list_queries"))
         self.assertContains(resp, '4')
 
+    def test_folders_are_counted_across_pages(self):
+        for i in range(3):
+            SimpleQueryFactory(title='foo - bar%s' % i)
+        SimpleQueryFactory(title='abc')
+        with patch('explorer.views.ListQueryView.paginate_by', 2):
+            resp = self.client.get(reverse("list_queries"), {'page': 2})
+        titles = [(q['title'], q['is_header']) for q in resp.context['object_list']]
+        self.assertEqual(titles, [('foo', True), ('foo - bar1', False), ('foo - bar2', False)])
+        self.assertEqual(resp.context['object_list'][0]['count'], 3)
+
+    def test_query_list_is_read_in_a_fixed_number_of_queries(self):
+        def count_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(reverse("list_queries"))
+            return len(ctx.captured_queries)
+
+        SimpleQueryFactory(title='foo - bar', created_by_user=self.user)
+        expected = count_queries()
+        for i in range(5):
+            SimpleQueryFactory(title='qux%s - bar' % i, created_by_user=self.user)
+        self.assertEqual(count_queries(), expected)
+
+    def test_search(self):
+        SimpleQueryFactory(title='foo - bar')
+        SimpleQueryFactory(title='qux', description='about Foo')
+        SimpleQueryFactory(title='mux')
+        resp = self.client.get(reverse("list_queries"), {'q': 'foo'})
+        titles = [q['title'] for q in resp.context['object_list'] if not q['is_header']]
+        self.assertEqual(titles, ['foo - bar', 'qux'])
+        self.assertContains(resp, 'value="foo"')
+
+    @patch('explorer.app_settings.EXPLORER_RECENT_QUERY_COUNT', 2)
+    def test_recently_viewed(self):
+        first, second, third = SimpleQueryFactory.create_batch(3)
+        other_user = User.objects.create_user('user', 'user@user.com', 'pwd')
+        for query in (first, second, first, third, third):
+            query.log(self.user)
+        second.log(other_user)
+        resp = self.client.get(reverse("list_queries"))
+        recent = resp.context['recent_queries']
+        self.assertEqual([ql.query for ql in recent], [third, first])
+        self.assertEqual(recent[0], QueryLog.objects.filter(query=third).first())
+
 
 class TestQueryCreateView(TransactionTestCase):
     def setUp(self):
@@ -51,7 +105,7 @@ class TestQueryCreateView(TransactionTestCase):
     def test_valid_query(self):
         self.client.login(username='admin', password='pwd')
         query = SimpleQueryFactory.build(sql='SELECT 1;')
-        data = model_to_dict(query)
+        data = query_form_data(query)
         data['action'] = "save"
         del data['id']
         del data['created_by_user']
@@ -63,7 +117,7 @@ class TestQueryCreateView(TransactionTestCase):
     def test_invalid_query(self):
         self.client.login(username='admin', password='pwd')
         query = SimpleQueryFactory.build(sql='SELECT foo; DELETE FROM foo;')
-        data = model_to_dict(query)
+        data = query_form_data(query)
         data['action'] = "save"
         del data['id']
         del data['created_by_user']
@@ -99,7 +153,7 @@ class TestQueryDetailView(TestCase):
     def test_posting_query_saves_correctly(self):
         expected = 'select 2;'
         query = SimpleQueryFactory(sql="select 1;")
-        data = model_to_dict(query)
+        data = query_form_data(query)
         data['sql'] = expected
         data['action'] = 'save'
         self.client.post(reverse("query_detail", kwargs={'query_id': query.id}), data)
@@ -123,6 +177,19 @@ class TestQueryDetailView(TestCase):
         self.client.get(reverse("query_detail", kwargs={'query_id': query.id}))
         self.assertNotEqual(old, Query.objects.get(pk=query.id).last_run_date)
 
+    def test_viewing_a_query_again_doesnt_write_to_it(self):
+        query = SimpleQueryFactory()
+        url = reverse("query_detail", kwargs={'query_id': query.id})
+        update = 'UPDATE "%s" SET "last_run_date"' % Query._meta.db_table
+
+        def writes():
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(url)
+            return [q for q in ctx.captured_queries if q['sql'].startswith(update)]
+
+        self.assertEqual(len(writes()), 1)
+        self.assertEqual(writes(), [])
+
     def test_doesnt_render_results_if_show_is_none(self):
         query = SimpleQueryFactory(sql='select 6870+1;')
         resp = self.client.get(reverse("query_detail", kwargs={'query_id': query.id}) + '?show=0')
@@ -206,6 +273,29 @@ class TestDownloadView(TestCase):
         self.assertEqual(len(json_data), 1)
         self.assertEqual(json_data, [{'two': 2}])
 
+    @patch('explorer.app_settings.EXPLORER_STREAMING_EXPORTS', True)
+    def test_streaming_download_returns_every_row(self):
+        query = SimpleQueryFactory(sql='select g from generate_series(1, 1500) g')
+        url = reverse("download_query", args=[query.pk]) + '?format=csv'
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['content-type'], 'text/csv')
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(len(content.splitlines()), 1501)
+
+    @patch('explorer.app_settings.EXPLORER_STREAMING_EXPORTS', True)
+    def test_streaming_download_bad_query_redirects_to_query_view(self):
+        query = SimpleQueryFactory(sql='bad')
+        url = reverse("download_query", args=[query.pk]) + '?format=csv'
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, f'/queries/{query.pk}/')
+
 
 class TestHomePage(TransactionTestCase):
     databases = ['default', 'alt']
@@ -232,6 +322,114 @@ class TestHomePage(TransactionTestCase):
         self.assertTemplateUsed(resp, 'explorer/home.html')
         self.assertContains(resp, '3401')
 
+    STATS = {
+        'full_result': False,
+        'columns': [{'name': 'g', 'stats': {'Sum': 10, 'Avg': 2.5, 'Min': 1, 'Max': 4, 'NUL': 0}}],
+    }
+
+    def test_column_stats_are_fetched_separately(self):
+        data = {'title': 'test', 'sql': 'select g, g::text from generate_series(1, 4) g'}
+        resp = self.client.post(reverse("explorer_index"), {**data, 'action': 'run'})
+        self.assertContains(resp, 'Show column statistics')
+        resp = self.client.post(reverse('query_stats'), {'stats-id': resp.context['stats_id']})
+        self.assertEqual(resp.json(), self.STATS)
+
+    @patch('explorer.app_settings.EXPLORER_RESULT_CACHE_TTL', 300)
+    def test_column_stats_of_cached_results_dont_run_the_query_again(self):
+        data = {'title': 'test', 'sql': 'select g, g::text from generate_series(1, 4) g'}
+        try:
+            resp = self.client.post(reverse("explorer_index"), {**data, 'action': 'run'})
+            with patch('explorer.models.QueryResult._execute_query') as execute_query:
+                resp = self.client.post(
+                    reverse('query_stats'), {'stats-id': resp.context['stats_id']}
+                )
+            execute_query.assert_not_called()
+            self.assertEqual(resp.json(), self.STATS)
+        finally:
+            result_cache.clear()
+
+    def test_saved_query_page_keeps_nothing_for_stats(self):
+        query = SimpleQueryFactory(sql='select g from generate_series(1, 4) g')
+        with patch('explorer.result_cache.ResultCache.keep_for_stats') as keep_for_stats:
+            resp = self.client.post(
+                reverse("query_detail", kwargs={'query_id': query.id}),
+                {'title': query.title, 'sql': query.sql, 'action': 'save'},
+            )
+        self.assertTemplateUsed(resp, 'explorer/query.html')
+        self.assertEqual(resp.context['data'], [[1], [2], [3], [4]])
+        keep_for_stats.assert_not_called()
+        self.assertIsNone(resp.context['stats_id'])
+
+    def test_column_stats_are_only_given_for_the_users_own_results(self):
+        data = {'title': 'test', 'sql': 'select 1', 'action': 'run'}
+        stats_id = self.client.post(reverse("explorer_index"), data).context['stats_id']
+        User.objects.create_user('user', 'user@user.com', 'pwd')
+        self.client.login(username='user', password='pwd')
+        for posted in ({'stats-id': stats_id}, {'stats-id': 'x'}, {'sql': 'select 1'}):
+            resp = self.client.post(reverse('query_stats'), posted)
+            self.assertEqual(resp.status_code, 400)
+            self.assertIn('expired', resp.json()['errors']['sql'][0])
+
+    @patch('explorer.app_settings.EXPLORER_RESULT_CACHE_TTL', 300)
+    def test_playground_offers_to_refresh_cached_results(self):
+        data = {'title': 'test', 'sql': 'select 1+3400;', 'action': 'run'}
+        try:
+            resp = self.client.post(reverse("explorer_index"), data)
+            self.assertNotContains(resp, 'Refresh results')
+            resp = self.client.post(reverse("explorer_index"), data)
+            self.assertContains(resp, 'Refresh results')
+            resp = self.client.post(reverse("explorer_index"), {**data, 'action': 'refresh'})
+            self.assertContains(resp, '3401')
+            self.assertNotContains(resp, 'Refresh results')
+        finally:
+            result_cache.clear()
+
+    @patch('explorer.app_settings.ENABLE_TASKS', True)
+    @patch('explorer.app_settings.EXPLORER_ASYNC_QUERIES', True)
+    @patch('explorer.tasks.execute_query_job')
+    def test_playground_runs_queries_as_jobs(self, mocked_task):
+        resp = self.client.post(
+            reverse("explorer_index"), {'title': 'test', 'sql': 'select 1+3400;', "action": "run"},
+        )
+        job = QueryJob.objects.get()
+        self.assertRedirects(resp, reverse('query_job', kwargs={'job_id': job.id}))
+        mocked_task.delay.assert_called_once_with(str(job.id), False)
+        self.assertEqual(job.run_by_user, self.user)
+        self.assertEqual(job.query_log.sql, 'select 1+3400;')
+
+        resp = self.client.get(reverse('query_job', kwargs={'job_id': job.id}))
+        self.assertContains(resp, 'Running query')
+        resp = self.client.get(reverse('query_job_status', kwargs={'job_id': job.id}))
+        self.assertEqual(resp.json(), {'status': 'pending', 'error': None})
+
+        job.run()
+        resp = self.client.get(reverse('query_job', kwargs={'job_id': job.id}))
+        self.assertNotContains(resp, 'Running query')
+        self.assertContains(resp, '3401')
+
+    def test_cancelling_a_query_that_is_not_running(self):
+        resp = self.client.post(reverse('query_cancel', kwargs={'execution_id': 'abc'}))
+        self.assertEqual(resp.json(), {'cancelled': False})
+
+    def test_playground_form_carries_an_execution_id(self):
+        resp = self.client.get(reverse("explorer_index"))
+        self.assertContains(resp, 'name="execution-id" value="%s"' % resp.context['execution_id'])
+
+    def test_query_jobs_can_be_cancelled(self):
+        job = QueryJob.objects.create(sql='select 1', limit=10, run_by_user=self.user)
+        resp = self.client.post(reverse('query_job_cancel', kwargs={'job_id': job.id}))
+        self.assertRedirects(resp, reverse('query_job', kwargs={'job_id': job.id}))
+        job.refresh_from_db()
+        self.assertEqual(job.status, QueryJob.CANCELLED)
+        resp = self.client.get(reverse('query_job', kwargs={'job_id': job.id}))
+        self.assertContains(resp, 'Query cancelled.')
+
+    def test_query_jobs_are_only_shown_to_the_user_who_ran_them(self):
+        other = User.objects.create_user('other', 'other@example.com', 'pwd')
+        job = QueryJob.objects.create(sql='select 1', limit=10, run_by_user=other)
+        resp = self.client.get(reverse('query_job', kwargs={'job_id': job.id}))
+        self.assertEqual(resp.status_code, 404)
+
     def test_playground_redirects_to_query_create_on_save_with_sql_query_param(self):
         resp = self.client.post(
             reverse("explorer_index"), {'sql': 'select 1+3400;', "action": "save"}
@@ -402,7 +600,7 @@ class TestCreatedBy(TestCase):
         self.client.login(username='admin', password='pwd')
 
         self.query = SimpleQueryFactory.build(created_by_user=self.user)
-        self.data = model_to_dict(self.query)
+        self.data = query_form_data(self.query)
         del self.data['id']
         self.data["created_by_user_id"] = self.user2.id
 
@@ -434,12 +632,12 @@ class TestQueryLog(TestCase):
     # Since it will be saved on the initial query creation, no need to log it
     def test_creating_query_does_not_save_to_log(self):
         query = SimpleQueryFactory()
-        self.client.post(reverse("query_create"), model_to_dict(query))
+        self.client.post(reverse("query_create"), query_form_data(query))
         self.assertEqual(0, QueryLog.objects.count())
 
     def test_query_saves_to_log(self):
         query = SimpleQueryFactory()
-        data = model_to_dict(query)
+        data = query_form_data(query)
         data['sql'] = 'select 12345;'
         data['action'] = 'run'
         self.client.post(reverse("explorer_index") + f"?query_id={query.id}", data)
@@ -447,7 +645,7 @@ class TestQueryLog(TestCase):
 
     def test_query_gets_logged_and_appears_on_log_page(self):
         query = SimpleQueryFactory()
-        data = model_to_dict(query)
+        data = query_form_data(query)
         data['sql'] = 'select 12345;'
         data['action'] = 'run'
         self.client.post(reverse("explorer_index") + f"?query_id={query.id}", data)
@@ -459,3 +657,52 @@ class TestQueryLog(TestCase):
 
         q = SimpleQueryFactory()
         self.assertFalse(QueryLog(sql='foo', query_id=q.id).is_playground)
+
+    def _page(self, params=''):
+        resp = self.client.get(reverse("explorer_logs") + '?' + params)
+        return [log.id for log in resp.context['recent_logs']], resp.context['page_obj']
+
+    def test_logs_are_paged_by_run_at(self):
+        run_at = timezone.now()
+        # Logs made at the same time are ordered by id
+        logs = [QueryLogFactory(run_at=run_at) for _ in range(3)]
+        logs += [QueryLogFactory(run_at=run_at - timedelta(minutes=i)) for i in range(1, 3)]
+        expected = [log.id for log in sorted(logs, key=lambda log: (log.run_at, log.id))][::-1]
+        with patch('explorer.views.ListQueryLogView.paginate_by', 2):
+            ids, page = self._page()
+            self.assertIsNone(page['newer'])
+            older = []
+            while page['older']:
+                older.append(ids)
+                ids, page = self._page(page['older'])
+            older.append(ids)
+            self.assertEqual(older, [expected[:2], expected[2:4], expected[4:]])
+            ids, page = self._page(page['newer'])
+            self.assertEqual(ids, expected[2:4])
+            ids, page = self._page(page['newer'])
+            self.assertEqual(ids, expected[:2])
+            self.assertIsNone(page['newer'])
+
+    def test_later_pages_are_not_read_by_offset(self):
+        QueryLogFactory.create_batch(3)
+        with patch('explorer.views.ListQueryLogView.paginate_by', 1):
+            _, page = self._page()
+            with CaptureQueriesContext(connection) as ctx:
+                self._page(page['older'])
+        self.assertFalse([q for q in ctx.captured_queries if 'OFFSET' in q['sql']])
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT(' in q['sql']])
+
+    def test_logs_are_filtered(self):
+        other_user = User.objects.create_user('user', 'user@user.com', 'pwd')
+        query = SimpleQueryFactory()
+        mine = QueryLogFactory(sql='select foo', run_by_user=self.user, connection='alt')
+        theirs = QueryLogFactory(sql='select bar', run_by_user=other_user, query=query)
+        self.assertEqual(self._page('q=FOO')[0], [mine.id])
+        self.assertEqual(self._page('user=User@user.com')[0], [theirs.id])
+        self.assertEqual(self._page('connection=alt')[0], [mine.id])
+        self.assertEqual(self._page('query_id=%s' % query.id)[0], [theirs.id])
+
+    def test_log_count_is_estimated(self):
+        resp = self.client.get(reverse("explorer_logs"))
+        self.assertIsInstance(resp.context['estimated_count'], int)
+        self.assertContains(resp, 'About %s logs' % resp.context['estimated_count'])
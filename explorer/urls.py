@@ -5,6 +5,8 @@ from django.urls import include, path
 
 from explorer.tasks import build_schema_cache_async
 from explorer.views import (
+    CancelQueryJobView,
+    CancelQueryView,
     CreateQueryView,
     DeleteQueryView,
     DownloadFromSqlView,
@@ -12,6 +14,9 @@ from explorer.views import (
     ListQueryLogView,
     ListQueryView,
     PlayQueryView,
+    QueryJobStatusView,
+    QueryJobView,
+    QueryStatsView,
     QueryView,
 )
 
@@ -19,11 +24,16 @@ urlpatterns = [
     path('', PlayQueryView.as_view(), name='explorer_index'),
     path('auth/', include('authbroker_client.urls', namespace='authbroker')),
     path('download/', DownloadFromSqlView.as_view(), name='download_sql'),
+    path('stats/', QueryStatsView.as_view(), name='query_stats'),
     path('queries/', ListQueryView.as_view(), name='list_queries'),
     path('queries/create/', CreateQueryView.as_view(), name='query_create'),
     path('queries/<int:query_id>/', QueryView.as_view(), name='query_detail'),
     path('queries/<int:query_id>/download/', DownloadQueryView.as_view(), name='download_query'),
     path('queries/<int:pk>/delete/', DeleteQueryView.as_view(), name='query_delete'),
+    path('executions/<str:execution_id>/cancel/', CancelQueryView.as_view(), name='query_cancel'),
+    path('jobs/<uuid:job_id>/', QueryJobView.as_view(), name='query_job'),
+    path('jobs/<uuid:job_id>/status/', QueryJobStatusView.as_view(), name='query_job_status'),
+    path('jobs/<uuid:job_id>/cancel/', CancelQueryJobView.as_view(), name='query_job_cancel'),
     path('logs/', ListQueryLogView.as_view(), name='explorer_logs'),
 ]
 
@@ -1,4 +1,8 @@
+import os
 import re
+import threading
+from collections import namedtuple
+from functools import lru_cache
 
 
 import sqlparse
@@ -6,6 +10,7 @@ from django.conf import settings
 from django.contrib.auth import REDIRECT_FIELD_NAME
 from django.contrib.auth.forms import AuthenticationForm
 from django.contrib.auth.views import LoginView
+from django.db import connections as django_connections
 from six import text_type
 
 from explorer import app_settings
@@ -21,18 +26,85 @@ def param(name):
     return "%s%s%s" % (EXPLORER_PARAM_TOKEN, name, EXPLORER_PARAM_TOKEN)
 
 
+PARAM_REGEX = re.compile(r"('?)\$\$([a-z0-9_]+)(?:\:([^\$]+))?\$\$('?)", re.I)
+
+ParamToken = namedtuple('ParamToken', ['name', 'text', 'quoted'])
+
+
+class SQLTemplate(object):
+    """
+    SQL with $$name:default$$ param tokens, parsed once into the tokens and the text between
+    them so that params can be swapped in with one pass over the parts. Templates are shared
+    between callers by get_sql_template, so they must not be changed.
+    """
+
+    def __init__(self, sql):
+        self.texts = []
+        self.tokens = []
+        self.params = {}
+        start = 0
+        for match in PARAM_REGEX.finditer(sql):
+            before, name, default, after = match.groups()
+            # A token that makes up a whole quoted string literal takes the quotes with it
+            quoted = bool(before and after)
+            token_start = match.start() if quoted else match.start(2) - 2
+            token_end = match.end() if quoted else match.end() - len(after)
+            self.texts.append(sql[start:token_start])
+            self.tokens.append(ParamToken(name.lower(), sql[token_start:token_end], quoted))
+            # Names and defaults are lowercased, as they always have been
+            self.params[name.lower()] = default.lower() if default else ''
+            start = token_end
+        self.texts.append(sql[start:])
+
+    def swap(self, params):
+        return self._render(params)[0]
+
+    def bind(self, params):
+        return self._render(params, bind=True)
+
+    def _render(self, params, bind=False):
+        params = {str(k).lower(): text_type(v) for k, v in params.items()} if params else {}
+        values = []
+        parts = [self.texts[0]]
+        for token, text in zip(self.tokens, self.texts[1:]):
+            if token.name not in params:
+                parts.append(token.text)
+            elif token.quoted and bind:
+                values.append(params[token.name])
+                parts.append(None)
+            elif token.quoted:
+                parts.append("'%s'" % params[token.name])
+            else:
+                parts.append(params[token.name])
+            parts.append(text)
+        if not values:
+            return ''.join(parts), values
+        return ''.join('%s' if p is None else p.replace('%', '%%') for p in parts), values
+
+
+@lru_cache(maxsize=256)
+def get_sql_template(sql):
+    return SQLTemplate(sql)
+
+
 def swap_params(sql, params):
-    p = params.items() if params else {}
-    for k, v in p:
-        regex = re.compile(r"\$\$%s(?:\:([^\$]+))?\$\$" % str(k).lower(), re.I)
-        sql = regex.sub(text_type(v), sql)
-    return sql
+    return get_sql_template(sql).swap(params)
+
+
+def bind_params(sql, params):
+    """
+    Swap params into sql as swap_params does, except for those that make up a whole quoted string
+    literal, such as '$$name$$', which are replaced by %s placeholders for the database driver to
+    bind the values to instead.
+
+    :return: The SQL and the values to bind to its placeholders, in order. When there are any,
+     every % of the SQL that isn't a placeholder is doubled, as the driver expects.
+    """
+    return get_sql_template(sql).bind(params)
 
 
 def extract_params(text):
-    regex = re.compile(r"\$\$([a-z0-9_]+)(?:\:([^\$]+))?\$\$")
-    params = re.findall(regex, text.lower())
-    return {p[0]: p[1] if len(p) > 1 else '' for p in params}
+    return dict(get_sql_template(text).params)
 
 
 def safe_login_prompt(request):
@@ -146,3 +218,35 @@ def get_total_pages(total_rows, page_size):
     if remainder:
         remainder = 1
     return int(total_rows / page_size) + remainder
+
+
+def estimated_count(queryset):
+    """
+    :return: The number of rows the planner estimates queryset has, from the table statistics,
+     which unlike a COUNT doesn't read the rows.
+    """
+    sql, params = queryset.query.sql_with_params()
+    with django_connections[queryset.db].cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    return plan[0]['Plan']['Plan Rows']
+
+
+class ProcessThread(object):
+    """
+    A daemon thread that runs target, started by the first call to start in each process. A
+    thread started before the process forked doesn't run in the child, so each process starts
+    its own.
+    """
+
+    def __init__(self, target):
+        self._target = target
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        threading.Thread(target=self._target, daemon=True).start()
@@ -1,29 +1,40 @@
 import re
-from collections import Counter
+import uuid
 from urllib.parse import urlencode
 
 import six
 from django.conf import settings
 from django.contrib.auth.views import LoginView
 from django.db import DatabaseError
-from django.db.models import Count
-from django.forms.models import model_to_dict
-from django.http import Http404, HttpResponse, HttpResponseRedirect
+from django.db.models import CharField, Count, F, Func, Q, Value
+from django.db.models.functions import Coalesce
+from django.http import (
+    Http404,
+    HttpResponse,
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.template.loader import render_to_string
 from django.urls import reverse, reverse_lazy
+from django.utils.dateparse import parse_datetime
 from django.views.generic import ListView
 from django.views.generic.base import View
 from django.views.generic.edit import CreateView, DeleteView
 
 from explorer import app_settings
+from explorer.cancellation import running_queries
 from explorer.connections import connections
 from explorer.exporters import get_exporter_class
 from explorer.forms import QueryForm
-from explorer.models import Query, QueryLog
+from explorer.log_writer import log_writer
+from explorer.models import Query, QueryJob, QueryLog, QueryResult
 from explorer.schema import schema_info
 from explorer.utils import (
+    estimated_count,
     get_total_pages,
+    safe_cast,
     url_get_log_id,
     url_get_page,
     url_get_params,
@@ -42,13 +53,19 @@ def _export(request, query, download=True):
     exporter_class = get_exporter_class(format)
     query.params = url_get_params(request)
     delim = request.GET.get('delim')
-    exporter = exporter_class(query)
+    exporter = exporter_class(query, request.user.pk)
     try:
-        output = exporter.get_output(delim=delim)
+        if app_settings.EXPLORER_STREAMING_EXPORTS:
+            output = exporter.get_streaming_output(delim=delim)
+        else:
+            output = exporter.get_output(delim=delim)
     except DatabaseError as e:
         msg = "Error executing query %s: %s" % (query.title, e)
         return HttpResponse(msg, status=500)
-    response = HttpResponse(output, content_type=exporter.content_type)
+    if app_settings.EXPLORER_STREAMING_EXPORTS:
+        response = StreamingHttpResponse(output, content_type=exporter.content_type)
+    else:
+        response = HttpResponse(output, content_type=exporter.content_type)
     if download:
         response['Content-Disposition'] = 'attachment; filename="%s"' % (exporter.get_filename())
     return response
@@ -71,19 +88,23 @@ class DownloadFromSqlView(View):
     def get(self, request, *args, **kwargs):
         sql = request.GET.get('sql')
         connection = request.GET.get('connection')
-        query = Query(sql=sql, connection=connection, title='')
-        ql = query.log(request.user)
-        query.title = 'Playground - %s' % ql.id
+        query = self._playground_query(request, sql, connection)
         return _export(request, query)
 
     def post(self, request, *args, **kwargs):
         sql = request.POST.get('sql')
         connection = request.POST.get('connection')
-        query = Query(sql=sql, connection=connection, title='')
-        ql = query.log(request.user)
-        query.title = 'Playground - %s' % ql.id
+        query = self._playground_query(request, sql, connection)
         return _export(request, query)
 
+    def _playground_query(self, request, sql, connection):
+        query = Query(sql=sql, connection=connection, title='')
+        ql = query.log(request.user, save=False)
+        log_writer.save(ql)
+        # Logs that are written behind have no id yet
+        query.title = 'Playground - %s' % ql.id if ql.id else 'Playground'
+        return query
+
 
 def _get_schema_html(connection):
     if connection not in connections:
@@ -92,68 +113,91 @@ def _get_schema_html(connection):
     return render_to_string('explorer/schema.html', {'schema': schema}) if schema else ""
 
 
+# The folder of a query in the list: its title up to the first ' - '
+QUERY_FOLDER = Func(
+    F('title'), Value(' - '), Value(1), function='split_part', output_field=CharField()
+)
+
+
 class ListQueryView(ListView):
     def recently_viewed(self):
-        qll = (
+        # The latest log of each query the user has run, read off the (run_by_user, query,
+        # -run_at) index
+        latest = (
             QueryLog.objects.filter(run_by_user=self.request.user, query_id__isnull=False)
+            .order_by('query_id', '-run_at')
+            .distinct('query_id')
+        )
+        return list(
+            QueryLog.objects.filter(id__in=latest.values('id'))
             .order_by('-run_at')
-            .select_related('query')
+            .select_related('query')[: app_settings.EXPLORER_RECENT_QUERY_COUNT]
         )
-        ret = []
-        tracker = []
-        for ql in qll:
-            if len(ret) == app_settings.EXPLORER_RECENT_QUERY_COUNT:
-                break
-
-            if ql.query_id not in tracker:
-                ret.append(ql)
-                tracker.append(ql.query_id)
-        return ret
 
     def get_context_data(self, **kwargs):
         context = super(ListQueryView, self).get_context_data(**kwargs)
-        context['object_list'] = self._build_queries_and_headers()
+        context['object_list'] = self._build_queries_and_headers(context['object_list'])
         context['recent_queries'] = self.recently_viewed()
         context['tasks_enabled'] = app_settings.ENABLE_TASKS
+        context['search'] = self.search
+        context['page_query'] = urlencode({'q': self.search}) + '&' if self.search else ''
         return context
 
+    @property
+    def search(self):
+        return self.request.GET.get('q', '').strip()
+
+    def _search(self, qs):
+        # Served by the trigram indexes on UPPER(title) and UPPER(description), where Postgres
+        # has the pg_trgm extension
+        if self.search:
+            qs = qs.filter(Q(title__icontains=self.search) | Q(description__icontains=self.search))
+        return qs
+
     def get_queryset(self):
-        qs = Query.objects.all()
-        return qs.annotate(run_count=Count('querylog'))
+        qs = Query.objects.annotate(folder=QUERY_FOLDER, run_count=Coalesce('stats__run_count', 0))
+        return self._search(qs).select_related('created_by_user').order_by('folder', 'title')
 
-    def _build_queries_and_headers(self):
+    def _build_queries_and_headers(self, queries):
         """
         Build a list of query information and headers (pseudo-folders)
         for consumption by the template.
 
         Strategy: Look for queries with titles of the form "something - else"
         (eg. with a ' - ' in the middle)
-        and split on the ' - ', treating the left side as a "header" (or folder). Interleave the
-        headers into the ListView's object_list as appropriate. Ignore headers that only have one
-        child. The front end uses bootstrap's JS Collapse plugin, which necessitates generating CSS
+        and split on the ' - ', treating the left side as a "header" (or folder). The queries are
+        ordered by folder in the database, so the headers are interleaved into the page of queries
+        where each folder starts, or the page starts, with the number of queries in the folder
+        counted in the database. Ignore headers that only have one child.
+        The front end uses bootstrap's JS Collapse plugin, which necessitates generating CSS
         classes to map the header onto the child rows, hence the collapse_target variable.
 
-        To make the return object homogeneous, convert the object_list models into dictionaries for
-        interleaving with the header "objects". This necessitates special handling of 'created_at'
-        and 'created_by_user' because model_to_dict doesn't include non-editable fields (created_at)
-        and will give the int representation of the user instead of the string representation.
+        To make the return object homogeneous, convert the query models into dictionaries for
+        interleaving with the header "objects".
 
-        :return: A list of model dictionaries representing all the query objects,
+        :return: A list of dictionaries representing the page of query objects,
         interleaved with header dictionaries.
         """
 
         dict_list = []
-        rendered_headers = []
         pattern = re.compile(r'[\W_]+')
 
-        headers = Counter([q.title.split(' - ')[0] for q in self.object_list])
+        folders = {q.folder for q in queries}
+        headers = dict(
+            self._search(Query.objects.annotate(folder=QUERY_FOLDER))
+            .filter(folder__in=folders)
+            .order_by()
+            .values('folder')
+            .annotate(count=Count('id'))
+            .values_list('folder', 'count')
+        )
 
-        for q in self.object_list:
-            model_dict = model_to_dict(q)
-            header = q.title.split(' - ')[0]
+        last_header = None
+        for q in queries:
+            header = q.folder
             collapse_target = pattern.sub('', header)
 
-            if headers[header] > 1 and header not in rendered_headers:
+            if headers[header] > 1 and header != last_header:
                 dict_list.append(
                     {
                         'title': header,
@@ -163,10 +207,13 @@ class ListQueryView(ListView):
                         'count': headers[header],
                     }
                 )
-                rendered_headers.append(header)
+            last_header = header
 
-            model_dict.update(
+            dict_list.append(
                 {
+                    'id': q.id,
+                    'title': q.title,
+                    'description': q.description,
                     'is_in_category': headers[header] > 1,
                     'collapse_target': collapse_target,
                     'created_at': q.created_at,
@@ -177,19 +224,87 @@ class ListQueryView(ListView):
                     else None,
                 }
             )
-
-            dict_list.append(model_dict)
         return dict_list
 
     model = Query
+    paginate_by = 100
 
 
 class ListQueryLogView(ListView):
+    """
+    The query logs, newest first, a page at a time. Pages are found by the (run_at, id) of the
+    log at the end of the last page, given in the before or after parameter, rather than by an
+    offset, so that later pages take no longer to read than the first. The number of logs is
+    estimated from the table statistics rather than counted.
+    """
+
+    filter_names = ('q', 'user', 'connection', 'query_id')
+
     def get_queryset(self):
         kwargs = {'sql__isnull': False}
         if url_get_query_id(self.request):
             kwargs['query_id'] = url_get_query_id(self.request)
-        return QueryLog.objects.filter(**kwargs).all()
+        filters = self._filters()
+        if filters.get('user'):
+            kwargs['run_by_user__email__iexact'] = filters['user']
+        if filters.get('connection'):
+            kwargs['connection'] = filters['connection']
+        if filters.get('q'):
+            kwargs['sql__icontains'] = filters['q']
+        return QueryLog.objects.filter(**kwargs).select_related('run_by_user')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['estimated_count'] = estimated_count(self.object_list)
+        context['filters'] = self._filters()
+        return context
+
+    def _filters(self):
+        return {
+            name: self.request.GET[name].strip()
+            for name in self.filter_names
+            if self.request.GET.get(name, '').strip()
+        }
+
+    def _cursor(self, name):
+        run_at, _, log_id = self.request.GET.get(name, '').rpartition(',')
+        try:
+            run_at = parse_datetime(run_at)
+        except ValueError:
+            return None
+        log_id = safe_cast(log_id, int)
+        return (run_at, log_id) if run_at and log_id else None
+
+    def _page_query(self, name=None, log=None):
+        params = self._filters()
+        if name:
+            params[name] = '%s,%s' % (log.run_at.isoformat(), log.id)
+        return urlencode(params)
+
+    def paginate_queryset(self, queryset, page_size):
+        before, after = self._cursor('before'), self._cursor('after')
+        if after:
+            run_at, log_id = after
+            logs = list(
+                queryset.filter(Q(run_at__gt=run_at) | Q(run_at=run_at, id__gt=log_id)).order_by(
+                    'run_at', 'id'
+                )[: page_size + 1]
+            )
+            has_newer, has_older = len(logs) > page_size, True
+            logs = logs[:page_size][::-1]
+        else:
+            if before:
+                run_at, log_id = before
+                queryset = queryset.filter(Q(run_at__lt=run_at) | Q(run_at=run_at, id__lt=log_id))
+            logs = list(queryset.order_by('-run_at', '-id')[: page_size + 1])
+            has_newer, has_older = bool(before), len(logs) > page_size
+            logs = logs[:page_size]
+        page = {
+            'newest': self._page_query() if before or after else None,
+            'newer': self._page_query('after', logs[0]) if has_newer and logs else None,
+            'older': self._page_query('before', logs[-1]) if has_older and logs else None,
+        }
+        return None, page, logs, bool(page['newest'] or page['older'])
 
     context_object_name = "recent_logs"
     model = QueryLog
@@ -291,6 +406,7 @@ class PlayQueryView(View):
                 'form': QueryForm(initial={"sql": request.GET.get('sql')}),
                 'form_action': self.get_form_action(request),
                 'schema': schema_info(connection_alias=settings.EXPLORER_DEFAULT_CONNECTION),
+                'execution_id': uuid.uuid4().hex,
             },
         )
 
@@ -321,9 +437,27 @@ class PlayQueryView(View):
             query_params = (('sql', sql),)
             return redirect(reverse('query_create') + f"?{urlencode(query_params)}")
 
-        elif action == 'run' or action == 'fetch-page':
+        elif action in ('run', 'fetch-page', 'refresh'):
             query.params = url_get_params(request)
-            response = self.render_with_sql(request, query, run_query=True, log=True)
+            if app_settings.ENABLE_TASKS and app_settings.EXPLORER_ASYNC_QUERIES:
+                if QueryForm(request.POST, instance=query).is_valid():
+                    job = QueryJob.submit(
+                        query,
+                        request.user,
+                        url_get_page(request),
+                        url_get_rows(request),
+                        refresh_cache=action == 'refresh',
+                    )
+                    return redirect(reverse('query_job', kwargs={'job_id': job.id}))
+            response = self.render_with_sql(
+                request,
+                query,
+                run_query=True,
+                log=True,
+                reuse_cursor=action == 'fetch-page',
+                refresh_cache=action == 'refresh',
+                execution_id=request.POST.get('execution-id') or None,
+            )
 
             return response
 
@@ -341,7 +475,16 @@ class PlayQueryView(View):
 
         return form_action
 
-    def render_with_sql(self, request, query, run_query=True, log=False):
+    def render_with_sql(
+        self,
+        request,
+        query,
+        run_query=True,
+        log=False,
+        reuse_cursor=False,
+        refresh_cache=False,
+        execution_id=None,
+    ):
         rows = url_get_rows(request)
         page = url_get_page(request)
         form = QueryForm(request.POST if request.method == 'POST' else None, instance=query)
@@ -361,16 +504,98 @@ class PlayQueryView(View):
             page=page,
             form=form,
             log=log,
+            reuse_cursor=reuse_cursor,
+            refresh_cache=refresh_cache,
+            execution_id=execution_id,
+            keep_for_stats=True,
         )
         context['schema'] = schema_info(connection_alias=settings.EXPLORER_DEFAULT_CONNECTION)
         context['form_action'] = self.get_form_action(request)
         return render(self.request, 'explorer/home.html', context)
 
 
+class QueryStatsView(View):
+    """
+    Summaries of the numeric columns of a page of results, fetched by the results page when they
+    are asked for rather than computed on every run. They are computed from the page kept by the
+    run that showed it, so that the query isn't run again, and nothing else can be summarised.
+    """
+
+    def post(self, request):
+        res = QueryResult.kept_for_stats(request.POST.get('stats-id'), request.user.pk)
+        if res is None:
+            message = 'These results have expired. Run the query again to see their statistics.'
+            return JsonResponse({'errors': {'sql': [message]}}, status=400)
+        try:
+            res.process()
+        except DatabaseError as e:
+            return JsonResponse({'errors': {'sql': [str(e)]}}, status=400)
+        return JsonResponse(
+            {
+                'full_result': res.stats_cover_full_result,
+                'columns': [
+                    {'name': str(h), 'stats': h.summary.stats} for h in res.headers if h.summary
+                ],
+            }
+        )
+
+
+class CancelQueryView(View):
+    def post(self, request, execution_id):
+        cancelled = running_queries.cancel(execution_id, request.user.pk)
+        return JsonResponse({'cancelled': bool(cancelled)})
+
+
+class QueryJobView(View):
+    def get(self, request, job_id):
+        job = get_object_or_404(QueryJob, pk=job_id, run_by_user=request.user)
+        query = job.query(title="Playground")
+        form = QueryForm(instance=query)
+        message = None
+        if job.status == QueryJob.FAILED:
+            form.add_error('sql', job.error)
+            message = "Query error"
+        elif job.status == QueryJob.CANCELLED:
+            message = "Query cancelled."
+        result = job.result()
+        if job.status == QueryJob.SUCCEEDED and result is None:
+            message = "These results have expired. Run the query again to see them."
+        context = query_viewmodel(
+            request.user,
+            query,
+            title="Home",
+            form=form,
+            message=message,
+            run_query=False,
+            rows=job.limit,
+            page=job.page,
+            result=result,
+            keep_for_stats=True,
+        )
+        context['job'] = job
+        context['ql_id'] = job.query_log_id
+        context['schema'] = schema_info(connection_alias=settings.EXPLORER_DEFAULT_CONNECTION)
+        context['form_action'] = reverse('explorer_index')
+        return render(self.request, 'explorer/home.html', context)
+
+
+class QueryJobStatusView(View):
+    def get(self, request, job_id):
+        job = get_object_or_404(QueryJob, pk=job_id, run_by_user=request.user)
+        return JsonResponse({'status': job.status, 'error': job.error})
+
+
+class CancelQueryJobView(View):
+    def post(self, request, job_id):
+        job = get_object_or_404(QueryJob, pk=job_id, run_by_user=request.user)
+        job.cancel()
+        return redirect(reverse('query_job', kwargs={'job_id': job.id}))
+
+
 class QueryView(View):
     def get(self, request, query_id):
         query, form = QueryView.get_instance_and_form(request, query_id)
-        query.save()  # updates the modified date
+        query.touch()  # updates the modified date
 
         # Overwrite SQL form field from GET query parameter (sent when saving an existing query from the playground).
         sql = request.GET.get("sql")
@@ -430,22 +655,36 @@ def query_viewmodel(
     page=1,
     method="POST",
     log=True,
+    reuse_cursor=False,
+    refresh_cache=False,
+    result=None,
+    execution_id=None,
+    keep_for_stats=False,
 ):
-    res = None
+    """
+    :param result: The QueryResult to show, when the query has already been run elsewhere.
+    :param keep_for_stats: Keep the page for its column statistics to be fetched, for a page
+     that offers them.
+    """
+    res = result
     ql = None
     error = None
     if run_query:
         try:
             if log:
-                res, ql = query.execute_with_logging(user, page, rows, timeout)
+                res, ql = query.execute_with_logging(
+                    user, page, rows, timeout, reuse_cursor, refresh_cache, execution_id
+                )
             else:
-                res = query.execute(page, rows, timeout)
+                res = query.execute(
+                    page, rows, timeout, user, reuse_cursor, refresh_cache, execution_id
+                )
         except DatabaseError as e:
             error = str(e)
     if error and method == "POST":
         form.add_error('sql', error)
         message = "Query error"
-    has_valid_results = not error and res and run_query
+    has_valid_results = not error and res
     ret = {
         'tasks_enabled': app_settings.ENABLE_TASKS,
         'params': query.available_params(),
@@ -458,11 +697,17 @@ def query_viewmodel(
         'data': res.data if has_valid_results else None,
         'headers': res.headers if has_valid_results else None,
         'total_rows': res.row_count if has_valid_results else None,
+        'total_rows_is_estimate': res.row_count_is_estimate if has_valid_results else False,
         'duration': res.duration if has_valid_results else None,
-        'has_stats': len([h for h in res.headers if h.summary]) if has_valid_results else False,
+        'from_cache': res.from_cache if has_valid_results else False,
+        'stats_id': None,
         'ql_id': ql.id if ql else None,
         'unsafe_rendering': app_settings.UNSAFE_RENDERING,
+        'execution_id': uuid.uuid4().hex,
     }
+    if keep_for_stats and has_valid_results and res.has_stats:
+        ret['stats_id'] = res.keep_for_stats(getattr(user, 'pk', None))
+    ret['has_stats'] = bool(ret['stats_id'])
     ret['total_pages'] = get_total_pages(ret['total_rows'], rows)
 
     return ret